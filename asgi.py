@@ -0,0 +1,116 @@
+"""ASGI entry point: async variants of the database-bound routes on the
+asyncio DB layer (async_utils), with every other route served by the Flask
+app in main.py through a WSGI adapter.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+Request parsing and response shapes come from main.py, so both entry points
+accept the same parameters and return the same JSON.
+"""
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept, MultiDict
+from werkzeug.http import parse_accept_header
+
+import async_utils
+from enpoints import (endpoint_connected_comments_async,
+                      endpoint_connected_posts_async)
+from main import app as flask_app
+from main import (approaches_response, connected_comments_args,
+                  connected_posts_args, create_approach_args,
+                  create_approach_response, feedback_args,
+                  list_approaches_args, wants_compact_graph)
+from utils import get_pool_status
+
+
+class FlaskJSONResponse(JSONResponse):
+    """Serialises with the Flask app's JSON provider, byte-for-byte like jsonify outside debug mode."""
+
+    def render(self, content):
+        return (flask_app.json.dumps(content, separators=(",", ":")) + "\n").encode("utf-8")
+
+def error_response(e):
+    return FlaskJSONResponse({"error": str(e)}, status_code=400)
+
+def query_args(request):
+    return MultiDict(list(request.query_params.multi_items()))
+
+async def get_connected_posts(request):
+    args = query_args(request)
+    try:
+        a_name, depth, max_nodes = connected_posts_args(args)
+    except ValueError as e:
+        return error_response(e)
+
+    accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+    result = await endpoint_connected_posts_async(
+        a_name, depth, compact=wants_compact_graph(args, accept), max_nodes=max_nodes
+    )
+    return FlaskJSONResponse(result)
+
+async def get_connected_comments(request):
+    try:
+        a_name, depth, limit, cursor = connected_comments_args(query_args(request))
+    except ValueError as e:
+        return error_response(e)
+
+    result = await endpoint_connected_comments_async(a_name, depth, limit, cursor)
+    return FlaskJSONResponse(result)
+
+async def get_approaches(request):
+    try:
+        args = list_approaches_args(query_args(request))
+    except ValueError as e:
+        return error_response(e)
+
+    order_by = args[5]
+    return FlaskJSONResponse(approaches_response(await async_utils.list_approaches(*args), order_by))
+
+async def create_new_approach(request):
+    try:
+        args = create_approach_args(await request.json())
+    except ValueError as e:
+        return error_response(e)
+
+    return FlaskJSONResponse(create_approach_response(*await async_utils.create_approach(*args)), status_code=201)
+
+async def send_feedback(request):
+    try:
+        name, email, feedback = feedback_args(await request.json())
+    except ValueError as e:
+        return error_response(e)
+
+    success = await async_utils.send_feedback_email(name, email, feedback)
+
+    if success:
+        return FlaskJSONResponse({"message": "Feedback sent successfully"}, status_code=200)
+    else:
+        return FlaskJSONResponse({"error": "Failed to send feedback"}, status_code=500)
+
+async def get_db_pool_status(request):
+    # Flask routes mounted below still check out from the psycopg2 pool
+    return FlaskJSONResponse({**get_pool_status(), "async": async_utils.get_async_pool_status()})
+
+@asynccontextmanager
+async def lifespan(app):
+    await async_utils.open_async_db_pool()
+    yield
+    await async_utils.close_async_db_pool()
+
+app = Starlette(
+    routes=[
+        Route('/api/connected-posts', get_connected_posts, methods=['GET']),
+        Route('/api/connected-comments', get_connected_comments, methods=['GET']),
+        Route('/api/approaches', get_approaches, methods=['GET']),
+        Route('/api/approaches', create_new_approach, methods=['POST']),
+        Route('/api/send-feedback', send_feedback, methods=['POST']),
+        Route('/api/internal/pool', get_db_pool_status, methods=['GET']),
+        # Everything else (CPU-bound pandas/torch endpoints) runs in a2wsgi's thread pool
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,178 @@
+"""Asyncio counterparts of the request-path database functions in utils.
+
+They run on a psycopg 3 AsyncConnectionPool instead of the blocking psycopg2
+pool, so a slow query only suspends the request waiting on it. The SQL, row
+decoding and the in-process connected-posts cache are shared with utils, so
+both stacks read and write the same rows the same way.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+import utils
+from utils import (CONNECTED_COMMENTS_SQL, CONNECTED_POSTS_SQL,
+                   CONNECTED_POSTS_STORAGE, COMMENTS_PAGE_SQL,
+                   CREATE_APPROACH_SQL, HYDRATE_NODES_SQL, NEEDS_FULL_READ,
+                   SAVE_CONNECTED_POSTS_SQL, SPOTLIGHTS_SQL,
+                   UPSERT_GRAPH_NODES_SQL, _approaches_page, _cache_lookup,
+                   _cache_store, _comments_page, _connected_comments_result,
+                   _connected_posts_params, _connected_posts_result,
+                   _create_approach_params, _graph_size, _group_spotlights,
+                   _hydrate_params, _list_approaches_query, db_connect_kwargs,
+                   invalidate_connected_posts_cache, page_nodes)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))
+
+async_pool: Optional[AsyncConnectionPool] = None
+async_pool_lock = asyncio.Lock()
+
+async def open_async_db_pool():
+    """Open the pool; called from the ASGI lifespan, or lazily by the first query."""
+    global async_pool
+
+    async with async_pool_lock:
+        if async_pool is not None:
+            return
+        new_pool = AsyncConnectionPool(
+            kwargs=db_connect_kwargs(),
+            min_size=1,
+            max_size=ASYNC_DB_POOL_SIZE,
+            timeout=utils.DB_POOL_TIMEOUT,
+            open=False,
+        )
+        await new_pool.open()
+        async_pool = new_pool
+        logger.info("Async database connection pool initialized successfully")
+
+async def close_async_db_pool():
+    global async_pool
+
+    if async_pool is not None:
+        await async_pool.close()
+        async_pool = None
+        logger.info("Async database connection pool closed successfully")
+
+def get_async_pool_status():
+    """psycopg_pool's own counters (wait/usage times, timeouts, queue length) for the async pool."""
+    if async_pool is None:
+        return {"status": "not_initialized"}
+    return {"status": "active", "timeout_seconds": async_pool.timeout, **async_pool.get_stats()}
+
+@asynccontextmanager
+async def get_async_db_connection():
+    """Async counterpart of `utils.get_db_connection`: commits on success, rolls back on error."""
+    if async_pool is None:
+        await open_async_db_pool()
+    async with async_pool.connection() as conn:
+        yield conn
+
+async def create_approach(main_article, node_id, link, type, label, email=None, comment=None):
+    async with get_async_db_connection() as conn:
+        cur = await conn.execute(
+            CREATE_APPROACH_SQL, _create_approach_params(main_article, node_id, link, type, label, email, comment)
+        )
+        approach_id, new_count, existed = await cur.fetchone()
+        return approach_id, new_count, existed
+
+async def _fetch_spotlights(conn, approach_ids, spotlight_limit=None):
+    if not approach_ids:
+        return {}
+    cur = await conn.execute(SPOTLIGHTS_SQL, (list(approach_ids), spotlight_limit))
+    return _group_spotlights(approach_ids, await cur.fetchall())
+
+async def list_approaches(limit=10, last_spotlight_count=None, last_created_at=None, last_id=None, filter_type=None, order_by='spotlights', spotlight_limit=None, last_comment_count=None):
+    async with get_async_db_connection() as conn:
+        cur = await conn.execute(*_list_approaches_query(
+            limit, last_spotlight_count, last_created_at, last_id, filter_type, order_by, last_comment_count
+        ))
+        approaches = await cur.fetchall()
+
+        spotlights = await _fetch_spotlights(conn, [approach[0] for approach in approaches[:limit]], spotlight_limit)
+
+    return _approaches_page(approaches, limit, spotlights)
+
+async def get_connected_posts_from_db(a_name, depth, max_nodes=0):
+    key = (a_name, depth, max_nodes)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        return cached
+
+    db_result = await fetch_connected_posts_from_db(a_name, depth, max_nodes)
+    if db_result is not None:
+        # Serialising a large graph for its size would stall the event loop
+        size = await asyncio.to_thread(_graph_size, db_result)
+        db_result = _cache_store(key, db_result, size)
+    return db_result
+
+async def fetch_connected_posts_from_db(a_name, depth, max_nodes=0):
+    async with get_async_db_connection() as conn:
+        cur = await conn.execute(CONNECTED_POSTS_SQL, {'a_name': a_name, 'depth': depth, 'max_nodes': max_nodes})
+        row = await cur.fetchone()
+
+        hydrated_nodes = None
+        if row and row[6] is not None:
+            params = _hydrate_params(row[6], row[7], row[0], depth)
+            if params is None:
+                return None
+            cur = await conn.execute(HYDRATE_NODES_SQL, params)
+            hydrated_nodes = (await cur.fetchone())[0]
+
+    if row is None:
+        return None
+    return _connected_posts_result(row, depth, max_nodes, hydrated_nodes)
+
+async def save_connected_posts_to_db(a_name, depth, result, compact=False, max_nodes=0, storage=None, data_version=None):
+    params, graph_nodes = _connected_posts_params(
+        a_name, depth, result, compact, max_nodes, storage or CONNECTED_POSTS_STORAGE, data_version,
+        jsonb=Jsonb, binary=bytes
+    )
+
+    async with get_async_db_connection() as conn:
+        if graph_nodes is not None:
+            await conn.execute(UPSERT_GRAPH_NODES_SQL, graph_nodes)
+        await conn.execute(SAVE_CONNECTED_POSTS_SQL, params)
+
+    invalidate_connected_posts_cache(a_name)
+
+async def get_connected_comments_from_db(a_name, depth):
+    async with get_async_db_connection() as conn:
+        cur = await conn.execute(CONNECTED_COMMENTS_SQL, (a_name, depth))
+        row = await cur.fetchone()
+
+        hydrated_nodes = None
+        if row and row[3] is not None:
+            params = _hydrate_params(row[3], row[4], row[0], depth)
+            if params is None:
+                return None
+            cur = await conn.execute(HYDRATE_NODES_SQL, params)
+            hydrated_nodes = (await cur.fetchone())[0]
+
+    if row is None:
+        return None
+    return _connected_comments_result(row, depth, hydrated_nodes)
+
+async def get_connected_comments_page_from_db(a_name, depth, limit, cursor=0):
+    async with get_async_db_connection() as conn:
+        cur = await conn.execute(
+            COMMENTS_PAGE_SQL, {'a_name': a_name, 'depth': depth, 'cursor': cursor, 'limit': limit + 1}
+        )
+        rows = await cur.fetchall()
+
+    page = _comments_page(rows, depth, limit)
+    if page is NEEDS_FULL_READ:
+        db_result = await get_connected_comments_from_db(a_name, depth)
+        if db_result is None:
+            return None
+        return page_nodes(db_result['nodes'], limit, cursor)
+    return page
+
+async def send_feedback_email(name: str, email: str, feedback: str) -> bool:
+    # SendGrid's client is blocking; keep it off the event loop
+    return await asyncio.to_thread(utils.send_feedback_email, name, email, feedback)
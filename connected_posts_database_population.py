@@ -1,65 +1,340 @@
 import argparse
-import asyncio
+import multiprocessing
 import os
-from datetime import datetime, timezone
+import time
+from contextlib import contextmanager
 
+import pandas as pd
+import psycopg2
 from sqlalchemy import create_engine, text
 from tqdm import tqdm
 
-from enpoints import endpoint_connected_posts, endpoint_get_articles
-from utils import close_db_pool, delete_all_connected_posts, get_db_connection
+# Importing enpoints starts a population run unless this is one
+os.environ.setdefault("POPULATION_PROCESS", "1")
+
+from enpoints import (COMPACT_DB_GRAPHS, DATA_VERSION, compute_connected_posts,
+                      df, endpoint_get_articles, get_post_id_by_title,
+                      graph_index)
+from knowledge_graph_visuals import estimate_graph_nodes
+from utils import (close_db_pool, connected_posts_copy_row,
+                   copy_connected_posts_to_db, db_connect_kwargs,
+                   delete_all_connected_posts, get_connected_posts_request_counts,
+                   get_current_connected_posts, get_db_connection)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 MAX_DB_SIZE_GB = 48
+# Stop this far below MAX_DB_SIZE_GB, covering the estimate between
+# measurements and the batch still waiting to be written
+SIZE_MARGIN_GB = float(os.getenv("POPULATION_SIZE_MARGIN_GB", 1))
+# Measure the real database size after this many stored graphs or seconds
+SIZE_CHECK_EVERY = int(os.getenv("POPULATION_SIZE_CHECK_EVERY", 200))
+SIZE_CHECK_SECONDS = float(os.getenv("POPULATION_SIZE_CHECK_SECONDS", 60))
+# How many recorded requests a post's karma/commentCount prior is worth
+DEMAND_PRIOR_WEIGHT = float(os.getenv("POPULATION_PRIOR_WEIGHT", 1))
+# Skip graphs estimated at more nodes than this per unit of expected demand (0 keeps every graph)
+MAX_COST_PER_DEMAND = float(os.getenv("POPULATION_MAX_COST_PER_DEMAND", 0))
+# Graphs the writer commits per transaction
+WRITE_BATCH_SIZE = int(os.getenv("POPULATION_BATCH_SIZE", 50))
 
-def get_db_size_gb():
+def get_db_size_bytes():
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT pg_database_size(current_database()) / 1024 / 1024 / 1024 as size_gb")
+        cur.execute("SELECT pg_database_size(current_database())")
         result = cur.fetchone()
         cur.close()
         return result[0]
 
-async def store_all_articles_in_db(depth=2):
+def get_db_size_gb():
+    return get_db_size_bytes() / 1024 / 1024 / 1024
+
+class SizeBudget:
+    """Keeps the database under `limit_gb` - `margin_gb` without measuring it per article.
+
+    pg_database_size stats every relation file, so it is only taken every
+    `check_every` stored graphs or `check_seconds`, and whenever the
+    estimate reaches the limit. In between, the size is the last measurement
+    plus the bytes handed to the writer since, committed or still pending,
+    scaled by the growth per committed byte seen between measurements (never
+    below 1, since TOAST compression usually makes rows smaller on disk than
+    their COPY text). The writer reports which bytes it has committed, so
+    only those calibrate the growth.
+    """
+
+    def __init__(self, limit_gb, margin_gb, check_every, check_seconds):
+        self.stop_at = (limit_gb - margin_gb) * 1024 ** 3
+        self.check_every = check_every
+        self.check_seconds = check_seconds
+        self.growth = 1.0
+        self.measured = None
+        self.pending = 0
+        self.measure()
+
+    def measure(self):
+        size = get_db_size_bytes()
+        if self.measured is not None and self.committed:
+            self.growth = max(1.0, (size - self.measured) / self.committed)
+        self.measured = size
+        self.measured_at = time.monotonic()
+        self.committed = 0
+        self.graphs = 0
+
+    def add(self, nbytes):
+        """Count a graph handed to the writer."""
+        self.pending += nbytes
+        self.graphs += 1
+
+    def commit(self, nbytes):
+        """Move `nbytes` of pending graphs to committed, as the writer flushes them."""
+        self.pending -= nbytes
+        self.committed += nbytes
+
+    def discard(self, nbytes):
+        """Forget `nbytes` of pending graphs the writer failed to store."""
+        self.pending -= nbytes
+
+    @property
+    def estimate(self):
+        return self.measured + (self.committed + self.pending) * self.growth
+
+    def exhausted(self):
+        if (self.graphs >= self.check_every
+                or time.monotonic() - self.measured_at >= self.check_seconds
+                or self.estimate >= self.stop_at):
+            self.measure()
+        return self.estimate >= self.stop_at
+
+def row_bytes(row):
+    """Bytes a connected_posts_copy_row writes: the COPY line plus any graph_nodes data."""
+    _, line, graph_nodes = row
+    return len(line) + (sum(len(data) for data in graph_nodes[2]) if graph_nodes is not None else 0)
+
+def schedule_articles(articles, depth, max_cost_per_demand=MAX_COST_PER_DEMAND):
+    """Order `articles` by expected demand per estimated graph node.
+
+    Demand is the recorded /api/connected-posts requests the graph would
+    serve plus DEMAND_PRIOR_WEIGHT times a popularity prior: the mean
+    percentile of the post's karma and commentCount. Never-requested posts
+    therefore still go popular-first. Cost is `estimate_graph_nodes`.
+    Titles without a post build nothing and go last. Returns the ordered
+    articles and how many were skipped for exceeding `max_cost_per_demand`.
+    """
+    requests = get_connected_posts_request_counts(depth)
+    prior = (
+        pd.to_numeric(df["karma"], errors="coerce").rank(pct=True).fillna(0)
+        + pd.to_numeric(df["commentCount"], errors="coerce").rank(pct=True).fillna(0)
+    ) / 2
+    prior.index = df["_id"]
+    prior = prior[~prior.index.duplicated()]
+
+    scored = []
+    unknown = []
+    skipped = 0
+    for article in articles:
+        post_id = get_post_id_by_title(article)
+        if post_id is None:
+            unknown.append(article)
+            continue
+        demand = requests.get(article, 0) + DEMAND_PRIOR_WEIGHT * prior[post_id]
+        cost = max(estimate_graph_nodes(graph_index, post_id, depth), 1)
+        if max_cost_per_demand and cost > max_cost_per_demand * demand:
+            skipped += 1
+            continue
+        scored.append((demand / cost, article))
+
+    # Stable, so ties keep the title-file order
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [article for _, article in scored] + unknown, skipped
+
+def serialise_article_graph(task):
+    """Compute and serialise one article's graph; runs in the worker processes.
+
+    Returns (article, connected_posts_copy_row or None for an unknown title,
+    error) rather than raising, so one bad article doesn't abort the whole map.
+    """
+    article, depth = task
+    try:
+        result = compute_connected_posts(article, depth)
+        if result is None:
+            return article, None, None
+        row = connected_posts_copy_row(article, depth, result, compact=COMPACT_DB_GRAPHS, data_version=DATA_VERSION)
+        return article, row, None
+    except Exception as e:
+        return article, None, f"Error processing article '{article}': {str(e)}"
+
+def computed_graphs(articles, depth, workers):
+    """Yield serialise_article_graph results, in completion order when `workers` > 1."""
+    tasks = [(article, depth) for article in articles]
+
+    if workers <= 1:
+        yield from map(serialise_article_graph, tasks)
+        return
+
+    # Workers are forked after the dataset is loaded, so they share df,
+    # comments, user_df and the graph index copy-on-write instead of each
+    # loading them. They never touch the database: pooled connections must
+    # not be shared across fork, so the parent reopens its pool afterwards.
+    close_db_pool()
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        yield from pool.imap_unordered(serialise_article_graph, tasks)
+
+@contextmanager
+def population_lock():
+    """Yield whether this run holds the population advisory lock.
+
+    Every worker boot may start a run; only one at a time does the work.
+    The lock lives on its own connection for the whole run, outside the
+    pool that is closed before forking.
+    """
+    conn = psycopg2.connect(**db_connect_kwargs())
     try:
-        delete_all_connected_posts()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('connected_posts_population'))")
+            yield cur.fetchone()[0]
+    finally:
+        conn.close()
+
+class GraphWriter:
+    """Single writer for the serialised graphs, COPYing `batch_size` per transaction.
+
+    With a `budget`, graphs are added to it as they are queued and reported
+    committed (or discarded) as batches are written.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, budget=None):
+        self.batch_size = batch_size
+        self.budget = budget
+        self.pending = []
+        self.successful = []
+        self.failed = []
+
+    def add(self, article, row):
+        if row is None:
+            # Unknown title: served as an empty graph and never stored
+            self._succeeded(article)
+            return
+        if self.budget is not None:
+            self.budget.add(row_bytes(row))
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            copy_connected_posts_to_db(batch)
+        except Exception:
+            # Retry one by one so failures are still reported per article
+            for row in batch:
+                self._save_one(row)
+            return
+        self._committed(batch)
+        for article, _, _ in batch:
+            self._succeeded(article)
+
+    def _save_one(self, row):
+        article = row[0]
+        try:
+            copy_connected_posts_to_db([row])
+        except Exception as e:
+            if self.budget is not None:
+                self.budget.discard(row_bytes(row))
+            self.fail(article, f"Error processing article '{article}': {str(e)}")
+            return
+        self._committed([row])
+        self._succeeded(article)
+
+    def _committed(self, rows):
+        if self.budget is not None:
+            self.budget.commit(sum(row_bytes(row) for row in rows))
+
+    def fail(self, article, error_message):
+        print(error_message)
+        self.failed.append((article, error_message))
+
+    def _succeeded(self, article):
+        self.successful.append(article)
+        print(f"Successfully processed article: '{article}'")
+
+def store_all_articles_in_db(depth=2, workers=1, batch_size=WRITE_BATCH_SIZE, rebuild=False, order="demand",
+                             max_cost_per_demand=MAX_COST_PER_DEMAND):
+    """Store the depth-`depth` graph of every article not yet stored for DATA_VERSION.
+
+    With `order` "demand", articles are built in `schedule_articles` order,
+    so the graphs most likely to be requested are stored first if the size
+    budget runs out; "title" keeps the title-file order.
+
+    Batches are committed as they fill, so committed rows are the checkpoint:
+    an interrupted run resumes where it stopped, and rows from an older
+    dataset keep serving requests until they are rebuilt. `rebuild` empties
+    the table first instead.
+    """
+    try:
+        if rebuild:
+            delete_all_connected_posts()
         articles = endpoint_get_articles()
+
+        current = get_current_connected_posts(depth, DATA_VERSION)
+        if current:
+            print(f"Skipping {len(current)} articles already stored for data version {DATA_VERSION}.")
+            articles = [article for article in articles if article not in current]
+
+        if order == "demand":
+            articles, skipped = schedule_articles(articles, depth, max_cost_per_demand)
+            print(f"Scheduled {len(articles)} articles by expected demand per graph node.")
+            if skipped:
+                print(f"Skipping {skipped} articles costing more than {max_cost_per_demand:g} nodes per unit of demand.")
         total_articles = len(articles)
 
-        print(f"Fetching and storing data for {total_articles} articles with depth {depth}...")
-        
-        successful = []
-        failed = []
+        print(f"Fetching and storing data for {total_articles} articles with depth {depth} on {workers} worker(s)...")
+
+        budget = SizeBudget(MAX_DB_SIZE_GB, SIZE_MARGIN_GB, SIZE_CHECK_EVERY, SIZE_CHECK_SECONDS)
+        writer = GraphWriter(batch_size, budget)
+        started = time.monotonic()
 
-        for article in tqdm(articles, total=total_articles):
-            try:
-                if get_db_size_gb() >= MAX_DB_SIZE_GB:
-                    print(f"Database size limit reached ({MAX_DB_SIZE_GB}GB). Stopping population.")
+        with tqdm(total=total_articles) as progress:
+            for article, row, error in computed_graphs(articles, depth, workers):
+                if error is not None:
+                    writer.fail(article, error)
+                    progress.update()
+                    continue
+
+                if budget.exhausted():
+                    print(f"Database size limit reached ({MAX_DB_SIZE_GB}GB, less a {SIZE_MARGIN_GB}GB margin). Stopping population.")
                     break
 
-                data = endpoint_connected_posts(article, depth=depth, population=True)
-                successful.append(article)
-                print(f"Successfully processed article: '{article}'")
-                
-                # Add a small delay between operations
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                error_message = f"Error processing article '{article}': {str(e)}"
-                print(error_message)
-                failed.append((article, error_message))
-
-        print(f"Successfully processed and stored {len(successful)} articles.")
-        if failed:
-            print(f"Failed to process {len(failed)} articles.")
-
-        return successful, failed
+                writer.add(article, row)
+                progress.update()
+                progress.set_postfix(stored=len(writer.successful), failed=len(writer.failed))
+
+        writer.flush()
+        elapsed = time.monotonic() - started
+        done = len(writer.successful) + len(writer.failed)
+        print(f"Processed {done} articles in {elapsed:.0f}s ({done / max(elapsed, 1e-9):.2f} articles/s).")
+
+        print(f"Successfully processed and stored {len(writer.successful)} articles.")
+        if writer.failed:
+            print(f"Failed to process {len(writer.failed)} articles.")
+
+        return writer.successful, writer.failed
     finally:
         print("Finalizing database population")
 
 def main():
     parser = argparse.ArgumentParser(description="Populate database with connected posts.")
     parser.add_argument("--depth", type=int, default=2, help="Depth for connected posts (default: 2)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("POPULATION_WORKERS", 1)),
+                        help="Processes computing graphs in parallel (default: $POPULATION_WORKERS or 1)")
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE,
+                        help="Graphs written per transaction (default: $POPULATION_BATCH_SIZE or 50)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Empty connected_posts and rebuild every graph instead of resuming")
+    parser.add_argument("--order", choices=["demand", "title"], default="demand",
+                        help="Build the most requested/popular graphs per node first, or in title order (default: demand)")
+    parser.add_argument("--max-cost-per-demand", type=float, default=MAX_COST_PER_DEMAND,
+                        help="Skip graphs estimated at more nodes per unit of demand (default: $POPULATION_MAX_COST_PER_DEMAND or 0, keep all)")
     args = parser.parse_args()
 
     initial_size = get_db_size_gb()
@@ -70,12 +345,20 @@ def main():
     print(f"Starting to search for the target article with depth {args.depth}...")
     print(f"Initial database size: {initial_size:.2f}GB")
 
-    successful, failed = asyncio.run(store_all_articles_in_db(depth=args.depth))
-    
+    with population_lock() as acquired:
+        if not acquired:
+            print("Another population run is in progress. Exiting.")
+            close_db_pool()
+            return
+        successful, failed = store_all_articles_in_db(
+            depth=args.depth, workers=args.workers, batch_size=args.batch_size, rebuild=args.rebuild,
+            order=args.order, max_cost_per_demand=args.max_cost_per_demand
+        )
+
     final_size = get_db_size_gb()
     print(f"Final database size: {final_size:.2f}GB")
     print(f"Successful articles: {len(successful)}")
-    
+
     if failed:
         print("Failed articles:")
         for article, reason in failed:
@@ -1,7 +1,9 @@
+import asyncio
 import json
 import os
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 import numpy as np
@@ -9,17 +11,26 @@ import pandas as pd
 import torch
 from streamlit_agraph import Config, ConfigBuilder, Edge, Node, agraph
 
+import async_utils
 from cav_calc import batch_author_similarity_score, compare_authors
 from Google import create_and_download_files
-from knowledge_graph_visuals import build_graph
+from knowledge_graph_visuals import (build_budgeted_graph, build_graph,
+                                     build_graph_index, estimate_graph_nodes,
+                                     load_comment_labels)
 from specter_cluster_viz import create_viz
-from utils import (get_connected_comments_from_db, get_connected_posts_from_db,
-                   save_connected_posts_to_db)
+from utils import (compact_graph, data_files_version,
+                   get_connected_comments_from_db,
+                   get_connected_comments_page_from_db,
+                   get_connected_posts_from_db, page_nodes,
+                   record_connected_posts_request, save_connected_posts_to_db)
 
 
 def start_population_script():
+  # The population run imports this module too; don't let it start another
+  if os.getenv("POPULATION_PROCESS"):
+      return
   try:
-      subprocess.Popen([sys.executable, 'run_population.py'])
+      subprocess.Popen([sys.executable, 'run_population.py'], env={**os.environ, "POPULATION_PROCESS": "1"})
       print("Population process started.")
   except Exception as e:
       print(f"Failed to start population process: {e}")
@@ -33,10 +44,32 @@ top_100_embeddings = torch.load("app_files/top_100_embeddings.pt")
 
 app_info: pd.DataFrame = pd.read_json("app_files/app_info_enhanced.jsonl", lines=True)
 comments = pd.read_parquet("app_files/lw_comments.parquet")
+comments["plain_text"] = load_comment_labels(
+    comments, "app_files/lw_comments_plain_text.parquet", source_path="app_files/lw_comments.parquet"
+)
 df = pd.read_parquet("app_files/lw_data.parquet")
 user_df = pd.read_parquet("app_files/users.parquet")
 df.fillna("", inplace=True)
 df["articles_id"] = df.index
+graph_index = build_graph_index(df, comments)
+
+# Stored graphs record which version of these files they were built from, so
+# population only rebuilds what predates the current dataset. Only the source
+# files count: derived caches like the comment label sidecar follow from them
+GRAPH_DATA_FILES = [
+    "app_files/lw_data.parquet",
+    "app_files/lw_comments.parquet",
+    "app_files/users.parquet",
+]
+DATA_VERSION = data_files_version(GRAPH_DATA_FILES)
+
+# Store connected_posts rows in the compact graph layout (see utils.compact_graph)
+COMPACT_DB_GRAPHS = os.getenv("COMPACT_DB_GRAPHS", "").lower() in ("1", "true")
+
+# Graph builds requested by the async endpoints run here, off the event loop
+graph_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("GRAPH_BUILD_THREADS", 4)), thread_name_prefix="graph-build"
+)
 
 with open("app_files/authors.json", "r") as f:
     author_name_list = json.load(f)
@@ -121,10 +154,37 @@ def calculate_dot_sizes(df: pd.DataFrame, min_size: float = 15, max_size: float
 
     return df
 
-def get_raw_graph(df: pd.DataFrame, comments: pd.DataFrame, post_id: str, user_df: pd.DataFrame, d: int = 2) -> tuple[list, list]:
-    df = calculate_dot_sizes(df)
-
-    return build_graph(df, comments, post_id, user_df, depth=d)
+def get_raw_graph(df: pd.DataFrame, comments: pd.DataFrame, post_id: str, user_df: pd.DataFrame, d: int = 2, index: dict | None = None, with_levels: bool = False) -> tuple[list, list]:
+    # `df` must already carry the dot_size_* columns (see below)
+    return build_graph(df, comments, post_id, user_df, depth=d, index=index, with_levels=with_levels)
+
+def build_title_index(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """Map each stripped title to the row positions carrying it, in df order.
+
+    Titles are not unique in the dataset; lookups that need a single post
+    take the first position, which is the row the old
+    `df[df["title"].str.strip() == a_name]` scans picked.
+    """
+    titles = df["title"].str.strip().to_numpy()
+    return pd.Series(np.arange(len(titles))).groupby(titles, sort=False).indices
+
+def get_post_id_by_title(a_name: str) -> str | None:
+    positions = title_index.get(a_name)
+    if positions is None:
+        return None
+    return df["_id"].iat[positions[0]]
+
+def get_positions_by_titles(titles: list[str]) -> np.ndarray:
+    matches = [title_index[title] for title in titles if title in title_index]
+    if not matches:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(matches))
+
+# Dot sizes only depend on the loaded dataset, so they are computed once here
+# instead of on every graph request (which also wrote into the shared `df` from
+# request threads). build_graph just gathers the rows it needs.
+df = calculate_dot_sizes(df)
+title_index = build_title_index(df)
 
 ###################################################################################################
 ###################################################################################################
@@ -160,7 +220,7 @@ def endpoint_similarity_score(article_list, compared_authors):
         [a for a in default_authors if a != "beren"]
     ]
 
-    article_idx = np.where(df["title"].str.strip().isin(article_list))[0]
+    article_idx = get_positions_by_titles(article_list)
  
     sim_scores_tensor, top_100_score = batch_author_similarity_score(
         [a for a in compared_authors],
@@ -225,51 +285,162 @@ def endpoint_specter_clustering(n, cluster_choice, select_by_content):
     }
 
 
-def endpoint_connected_posts(a_name, depth, population=False):
-    # Try to get the result from database
-    db_result = get_connected_posts_from_db(a_name, depth)
+def graph_response(result, compact=False):
+    """Optionally re-encode a {'nodes', 'edges', ...} response in the compact format."""
+    if not compact:
+        return result
+    return {
+        **{key: value for key, value in result.items() if key not in ('nodes', 'edges')},
+        **compact_graph(result['nodes'], result['edges']),
+    }
+
+def _is_up_to_date(db_result):
+    # Convert to date for comparison, handling both string and datetime inputs
+    db_date = (db_result['updated_at'].date() 
+              if isinstance(db_result['updated_at'], datetime) 
+              else datetime.strptime(db_result['updated_at'], "%Y-%m-%d %H:%M:%S").date())
+    current_date = datetime.now(timezone.utc).date()
     
+    return db_date == current_date
+
+def _serves_request(db_result, population):
     # Check if db_result exists and has required data
-    if db_result and 'updated_at' in db_result:
-        # Convert to date for comparison, handling both string and datetime inputs
-        db_date = (db_result['updated_at'].date() 
-                  if isinstance(db_result['updated_at'], datetime) 
-                  else datetime.strptime(db_result['updated_at'], "%Y-%m-%d %H:%M:%S").date())
-        current_date = datetime.now(timezone.utc).date()
-        
-        is_up_to_date = db_date == current_date
-        
-        if not population or (population and is_up_to_date):
-            return db_result
+    if not db_result or 'updated_at' not in db_result:
+        return False
+    return not population or _is_up_to_date(db_result)
 
-    # If not found in database or data is invalid, compute the result
-    filtered = df[df["title"].str.strip() == a_name]
+def _empty_graph():
+    return {
+        'nodes': [],
+        'edges': [],
+        'updated_at': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    }
 
-    if filtered.empty:
-        return {
-            'nodes': [],
-            'edges': [],
-            'updated_at': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-        }
+def _post_nodes_only(result):
+    return {
+        **result,
+        'nodes': [node for node in result['nodes'] if node['type'] == 'post'],
+    }
+
+def compute_connected_posts(a_name, depth, max_nodes=None):
+    """Build the level-tagged graph for `a_name`, or None for an unknown title.
+
+    This is the CPU-heavy part of the connected-posts endpoints.
+    """
+    post_id = get_post_id_by_title(a_name)
 
-    post_id = filtered["_id"].values[0]
-    raw_nodes, raw_edges = get_raw_graph(df, comments, post_id, user_df, d=depth)
+    if post_id is None:
+        return None
+
+    if max_nodes:
+        raw_nodes, raw_edges, truncated = build_budgeted_graph(
+            df, comments, post_id, user_df, depth=depth, max_nodes=max_nodes, index=graph_index, with_levels=True
+        )
+    else:
+        # Level-tagged so the stored row also serves every shallower depth
+        raw_nodes, raw_edges = get_raw_graph(df, comments, post_id, user_df, d=depth, index=graph_index, with_levels=True)
 
     result = {
         'nodes': raw_nodes,
         'edges': raw_edges,
     }
+    if max_nodes:
+        result['truncated'] = truncated
+    return result
+
+def _graph_budget(a_name, depth, max_nodes):
+    """The budget to build `a_name`'s graph with, or None when the full graph is served.
+
+    A graph that fits `max_nodes` whole is the full graph, so it is served
+    from (and stored as) the full graph's row rather than a per-budget copy.
+    """
+    if not max_nodes:
+        return None
+    post_id = get_post_id_by_title(a_name)
+    if post_id is None or estimate_graph_nodes(graph_index, post_id, depth) <= max_nodes:
+        return None
+    return max_nodes
+
+def _budget_response(result, max_nodes, budget):
+    # A budgeted request answered with the full graph was not truncated
+    if max_nodes and not budget:
+        return {**result, 'truncated': False}
+    return result
+
+def endpoint_connected_posts(a_name, depth, population=False, compact=False, max_nodes=None):
+    if not population:
+        # Feeds the demand ordering of population runs
+        record_connected_posts_request(a_name, depth)
+
+    # Try to get the result from database; budgeted graphs are cached separately
+    budget = _graph_budget(a_name, depth, max_nodes)
+    db_result = get_connected_posts_from_db(a_name, depth, budget or 0)
+    
+    if _serves_request(db_result, population):
+        return graph_response(_budget_response(db_result, max_nodes, budget), compact)
+
+    # If not found in database or data is invalid, compute the result
+    result = compute_connected_posts(a_name, depth, budget)
+
+    if result is None:
+        return graph_response(_empty_graph(), compact)
 
     # Save the result to the database
-    save_connected_posts_to_db(a_name, depth, result)
+    save_connected_posts_to_db(
+        a_name, depth, result, compact=COMPACT_DB_GRAPHS, max_nodes=budget or 0, data_version=DATA_VERSION
+    )
 
     # Return only post nodes and edges
+    return graph_response(_budget_response(_post_nodes_only(result), max_nodes, budget), compact)
+
+async def endpoint_connected_posts_async(a_name, depth, population=False, compact=False, max_nodes=None):
+    """`endpoint_connected_posts` on the async DB layer, building graphs in `graph_executor`."""
+    if not population:
+        record_connected_posts_request(a_name, depth)
+
+    budget = _graph_budget(a_name, depth, max_nodes)
+    db_result = await async_utils.get_connected_posts_from_db(a_name, depth, budget or 0)
+
+    if _serves_request(db_result, population):
+        return graph_response(_budget_response(db_result, max_nodes, budget), compact)
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(graph_executor, compute_connected_posts, a_name, depth, budget)
+
+    if result is None:
+        return graph_response(_empty_graph(), compact)
+
+    await async_utils.save_connected_posts_to_db(
+        a_name, depth, result, compact=COMPACT_DB_GRAPHS, max_nodes=budget or 0, data_version=DATA_VERSION
+    )
+
+    return graph_response(_budget_response(_post_nodes_only(result), max_nodes, budget), compact)
+
+def _comment_nodes_only(nodes):
+    return [node for node in nodes if node['type'] == 'comment']
+
+def endpoint_connected_comments_page(a_name, depth, limit, cursor=0):
+    page = get_connected_comments_page_from_db(a_name, depth, limit, cursor)
+
+    if page is None:
+        # Store the graph so the following pages are sliced from the same row
+        result = compute_connected_posts(a_name, depth)
+        if result is None:
+            return {'nodes': [], 'nextCursor': None}
+
+        save_connected_posts_to_db(a_name, depth, result, compact=COMPACT_DB_GRAPHS, data_version=DATA_VERSION)
+        page = page_nodes(_comment_nodes_only(result['nodes']), limit, cursor)
+
+    nodes, next_cursor = page
     return {
-        'nodes': [node for node in raw_nodes if node['type'] == 'post'],
-        'edges': raw_edges
+        'nodes': nodes,
+        'nextCursor': next_cursor
     }
 
-def endpoint_connected_comments(a_name, depth):
+def endpoint_connected_comments(a_name, depth, limit=None, cursor=0):
+    if limit is not None:
+        return endpoint_connected_comments_page(a_name, depth, limit, cursor)
+
     # Try to get the result from database
     db_result = get_connected_comments_from_db(a_name, depth)
     
@@ -277,20 +448,59 @@ def endpoint_connected_comments(a_name, depth):
         return db_result
 
     # If not found in database, compute the result
-    filtered = df[df["title"].str.strip() == a_name]
+    post_id = get_post_id_by_title(a_name)
 
-    if not filtered.empty:
-        post_id = filtered["_id"].values[0]
-    else:
+    if post_id is None:
         return {
             'nodes': [],
         }
 
-    raw_nodes, _ = get_raw_graph(df, comments, post_id, user_df, d=depth)
+    raw_nodes, _ = get_raw_graph(df, comments, post_id, user_df, d=depth, index=graph_index)
 
     # Return only comment nodes
     return {
-        'nodes': [node for node in raw_nodes if node['type'] == 'comment']
+        'nodes': _comment_nodes_only(raw_nodes)
+    }
+
+async def endpoint_connected_comments_async(a_name, depth, limit=None, cursor=0):
+    """`endpoint_connected_comments` on the async DB layer, building graphs in `graph_executor`."""
+    loop = asyncio.get_running_loop()
+
+    if limit is not None:
+        page = await async_utils.get_connected_comments_page_from_db(a_name, depth, limit, cursor)
+
+        if page is None:
+            result = await loop.run_in_executor(graph_executor, compute_connected_posts, a_name, depth)
+            if result is None:
+                return {'nodes': [], 'nextCursor': None}
+
+            await async_utils.save_connected_posts_to_db(a_name, depth, result, compact=COMPACT_DB_GRAPHS, data_version=DATA_VERSION)
+            page = page_nodes(_comment_nodes_only(result['nodes']), limit, cursor)
+
+        nodes, next_cursor = page
+        return {
+            'nodes': nodes,
+            'nextCursor': next_cursor
+        }
+
+    db_result = await async_utils.get_connected_comments_from_db(a_name, depth)
+
+    if db_result:
+        return db_result
+
+    post_id = get_post_id_by_title(a_name)
+
+    if post_id is None:
+        return {
+            'nodes': [],
+        }
+
+    raw_nodes, _ = await loop.run_in_executor(
+        graph_executor, lambda: get_raw_graph(df, comments, post_id, user_df, d=depth, index=graph_index)
+    )
+
+    return {
+        'nodes': _comment_nodes_only(raw_nodes)
     }
 
 def endpoint_get_authors():
@@ -0,0 +1,14 @@
+"""gunicorn settings, read from the working directory by `gunicorn main:app`."""
+
+
+def post_fork(server, worker):
+    import utils
+
+    # A pool built in a preloaded master shares its sockets with the master;
+    # drop it without closing them and open this worker's own, warm
+    utils.connection_pool = None
+    try:
+        utils.initialize_db_pool(workers=server.cfg.workers, threads=server.cfg.threads, prewarm=True)
+    except Exception as e:
+        # The first request retries; don't take the worker down with the database
+        server.log.warning(f"Could not open the database pool in worker {worker.pid}: {e}")
@@ -1,157 +1,409 @@
 import html
+import os
 import re
 
+import numpy as np
 import pandas as pd
-import tqdm
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
-def load_post_centroid(df, comments, post_id, pingback=True):
-    main_post = df[df["_id"] == post_id]
+def _build_csr(linked_lists, pos_by_id):
+    n = len(linked_lists)
+    linked = pd.Series(linked_lists, index=np.arange(n)).explode()
+    targets = linked.map(pos_by_id)
+    keep = targets.notna().to_numpy()
+    sources = linked.index.to_numpy()[keep]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets, targets.to_numpy()[keep].astype(np.int64)
 
-    if pingback:
-        if len(main_post["pingback"].values) == 0:
-            return pd.DataFrame(), pd.DataFrame()
-        linked_articles = main_post["pingback"].values[0]
-    else:
-        if len(main_post["refs"].values) == 0:
-            return pd.DataFrame(), pd.DataFrame()
-        linked_articles = main_post["refs"].values[0]
-    linked_posts = df[df["_id"].isin(linked_articles)]
-    new_df = pd.concat([main_post, linked_posts])
-    relevant_comments = comments[comments["postId"].isin(new_df["_id"].unique())]
-    return new_df, relevant_comments
-
-def get_refs_tree(df, comments, post_id, depth=1, pingback=True):
-    queue = [post_id]
+def build_graph_index(df, comments):
+    """Build the integer adjacency index used by the BFS helpers.
+
+    Post ids are mapped to their row positions in `df`, and the `refs` and
+    `pingback` columns are stored as CSR offset/target arrays over those
+    positions. Linked ids that are not in `df` are dropped. Comments are
+    grouped by the position of their post, so a post's comments are the
+    slice `comment_rows[comment_offsets[pos]:comment_offsets[pos + 1]]` of
+    row positions into `comments` (in table order). `priority` ranks posts by
+    (karma, upvoteCount, commentCount) for budgeted expansion. Build this once
+    after the dataset is loaded and pass it to `build_graph`.
+    """
+    ids = df["_id"].to_numpy()
+    pos_by_id = pd.Series(np.arange(len(ids)), index=ids)
+    pos_by_id = pos_by_id[~pos_by_id.index.duplicated()]
+    refs_offsets, refs_targets = _build_csr(df["refs"].to_numpy(), pos_by_id)
+    pingback_offsets, pingback_targets = _build_csr(df["pingback"].to_numpy(), pos_by_id)
+
+    comment_post_pos = comments["postId"].map(pos_by_id).to_numpy()
+    has_post = ~np.isnan(comment_post_pos)
+    comment_rows = np.flatnonzero(has_post)
+    comment_post_pos = comment_post_pos[has_post].astype(np.int64)
+    order = np.argsort(comment_post_pos, kind="stable")
+    comment_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(comment_post_pos, minlength=len(ids)), out=comment_offsets[1:])
+
+    priority_keys = [
+        pd.to_numeric(df[column], errors="coerce").fillna(0).to_numpy()
+        for column in ["commentCount", "upvoteCount", "karma"]
+    ]
+    priority = np.empty(len(ids), dtype=np.int64)
+    priority[np.lexsort(priority_keys)] = np.arange(len(ids))
+
+    return {
+        "pos_by_id": pos_by_id.to_dict(),
+        "refs_offsets": refs_offsets,
+        "refs_targets": refs_targets,
+        "pingback_offsets": pingback_offsets,
+        "pingback_targets": pingback_targets,
+        "comment_offsets": comment_offsets,
+        "comment_rows": comment_rows[order],
+        "priority": priority,
+    }
+
+def _neighbours(index, key, pos):
+    offsets = index[key + "_offsets"]
+    return index[key + "_targets"][offsets[pos]:offsets[pos + 1]]
+
+def _gather_comment_rows(index, positions, ranks):
+    """Return the `comments` row positions for the given posts, ordered by (rank, table order)."""
+    offsets = index["comment_offsets"]
+    positions = np.asarray(positions, dtype=np.int64)
+    counts = offsets[positions + 1] - offsets[positions]
+    if counts.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    rows = np.concatenate([index["comment_rows"][offsets[p]:offsets[p + 1]] for p in positions])
+    row_ranks = np.repeat(np.asarray(ranks, dtype=np.int64), counts)
+    return rows[np.lexsort((rows, row_ranks))]
+
+def expand_post_positions(index, post_id, depth):
+    """Return the positions of the posts a depth-`depth` BFS expands, in visit
+    order, and the BFS level (0 for `post_id`) each one was expanded at."""
+    start = index["pos_by_id"].get(post_id)
+    queue = [] if start is None else [start]
     visited = set()
-    refs = []
-    comms = []
+    expanded = []
+    levels = []
 
-    for i in range(depth):
+    for level in range(depth):
         new_queue = []
-        for current_post_id in queue:
-            if current_post_id in visited:
+        for pos in queue:
+            if pos in visited:
                 continue
-            visited.add(current_post_id)
+            visited.add(pos)
+            expanded.append(pos)
+            levels.append(level)
 
-            post_df, comm_df = load_post_centroid(df, comments, current_post_id, pingback=pingback)
+            # Add the next level of refs and pingback posts to the queue
+            new_queue.extend(_neighbours(index, "pingback", pos))
+            new_queue.extend(_neighbours(index, "refs", pos))
 
-            if post_df.empty:
-                continue  # Skip if the post is not found
+        queue = new_queue
 
-            refs.append(post_df)
-            comms.append(comm_df)
+    return expanded, levels
 
-            # Add the next level of refs and pingback posts to the queue
-            if len(post_df["pingback"].values) > 0:
-                new_queue.extend(post_df["pingback"].values[0])
-            if len(post_df["refs"].values) > 0:
-                new_queue.extend(post_df["refs"].values[0])
+def estimate_graph_nodes(index, post_id, depth):
+    """How many nodes `build_graph` would return for `post_id`, from the index
+    alone: the expanded posts, the posts they link to and all their comments."""
+    expanded, _ = expand_post_positions(index, post_id, depth)
+    if not expanded:
+        return 0
+    positions = np.unique(np.concatenate(
+        [np.asarray(expanded, dtype=np.int64)]
+        + [_neighbours(index, key, pos) for pos in expanded for key in ("pingback", "refs")]
+    ))
+    offsets = index["comment_offsets"]
+    return len(positions) + int((offsets[positions + 1] - offsets[positions]).sum())
+
+def expand_post_positions_budgeted(index, post_id, depth, max_nodes):
+    """Budgeted variant of `expand_post_positions`.
+
+    Each BFS level is expanded in priority order (karma, then upvoteCount,
+    then commentCount), and an expansion admits its linked posts in the same
+    order while the running count of posts plus their comments stays within
+    `max_nodes`. Posts that don't fit are skipped and never expanded; the
+    start post is always admitted. Returns `(expanded, levels, allowed,
+    truncated)`, where `allowed` is the set of admitted post positions.
+    """
+    start = index["pos_by_id"].get(post_id)
+    if start is None:
+        return [], [], set(), False
+
+    priority = index["priority"]
+    comment_offsets = index["comment_offsets"]
+
+    def cost(pos):
+        # Plain ints so `truncated` stays a Python bool, which psycopg2 and
+        # jsonify can serialise
+        return 1 + int(comment_offsets[pos + 1] - comment_offsets[pos])
+
+    allowed = {start}
+    used = cost(start)
+    truncated = bool(used > max_nodes)
+    queue = [start]
+    visited = set()
+    expanded = []
+    levels = []
+
+    for level in range(depth):
+        new_queue = []
+        for pos in sorted(set(queue) - visited, key=lambda p: -priority[p]):
+            visited.add(pos)
+            expanded.append(pos)
+            levels.append(level)
+
+            linked = np.union1d(_neighbours(index, "pingback", pos), _neighbours(index, "refs", pos))
+            for p in sorted(linked, key=lambda p: -priority[p]):
+                if p not in allowed:
+                    if used + cost(p) > max_nodes:
+                        truncated = True
+                        continue
+                    allowed.add(p)
+                    used += cost(p)
+                new_queue.append(p)
 
         queue = new_queue
 
-    ref_df = pd.concat(refs).drop_duplicates(subset="_id")
-    comms_df = pd.concat(comms).drop_duplicates(subset="_id")
+    return expanded, levels, allowed, truncated
+
+def _collect_tree(index, expanded, key, allowed=None):
+    # Each expanded post contributes itself plus its `key`-linked posts (in df
+    # order); a post's rank is the first expansion that pulled it in.
+    rank_by_pos = {}
+    for rank, pos in enumerate(expanded):
+        for p in [pos, *np.unique(_neighbours(index, key, pos))]:
+            if p not in rank_by_pos and (allowed is None or p in allowed):
+                rank_by_pos[p] = rank
+    return rank_by_pos
+
+def get_refs_tree(df, comments, post_id, depth=1, pingback=True, index=None):
+    if index is None:
+        index = build_graph_index(df, comments)
+    key = "pingback" if pingback else "refs"
+
+    expanded, _ = expand_post_positions(index, post_id, depth)
+    rank_by_pos = _collect_tree(index, expanded, key)
+    positions = list(rank_by_pos)
+
+    ref_df = df.iloc[positions]
+    comment_rows = _gather_comment_rows(index, positions, list(rank_by_pos.values()))
+    comms_df = comments.iloc[comment_rows].drop_duplicates(subset="_id")
     return ref_df, comms_df
 
-def get_graph_dfs(df, comments, post_id, user_df, d=2):
-    pingback_df, pingback_comment_df = get_refs_tree(df, comments, post_id, depth=d, pingback=True)
-    ref_df, ref_comment_df = get_refs_tree(df, comments, post_id, depth=d, pingback=False)
-    post_df = pd.concat([pingback_df, ref_df])
-    comment_df = pd.concat([pingback_comment_df, ref_comment_df])
-    post_df.drop_duplicates(subset="_id", inplace=True)
-    comment_df.drop_duplicates(subset="_id", inplace=True)
+def get_graph_dfs(df, comments, post_id, user_df, d=2, index=None):
+    """Return the posts, comments and users in the depth-`d` neighbourhood of `post_id`.
+
+    The BFS follows both refs and pingbacks whichever tree is being built, so
+    the pingback and refs trees expand the same posts. One traversal is run
+    and both link directions are collected from it; `reached_via` on the post
+    frame records whether a post came from the "pingback" tree, the "refs"
+    tree or "both". Rows are ordered as if the pingback tree were
+    concatenated with the refs tree and de-duplicated.
+
+    Both frames also get a `level` column: the smallest depth at which the
+    row would be part of the graph, so the depth-k graph for any k <= d is
+    the rows with `level <= k`.
+    """
+    post_df, comment_df, relevant_user_df, _ = _get_graph_dfs(df, comments, post_id, user_df, d, index)
+    return post_df, comment_df, relevant_user_df
+
+def _get_graph_dfs(df, comments, post_id, user_df, d=2, index=None, max_nodes=None):
+    if index is None:
+        index = build_graph_index(df, comments)
+    if max_nodes is None:
+        expanded, levels = expand_post_positions(index, post_id, d)
+        allowed, truncated = None, False
+    else:
+        expanded, levels, allowed, truncated = expand_post_positions_budgeted(index, post_id, d, max_nodes)
+    pingback_ranks = _collect_tree(index, expanded, "pingback", allowed)
+    refs_ranks = _collect_tree(index, expanded, "refs", allowed)
+
+    # refs-only posts sort after the whole pingback tree
+    rank_by_pos = dict(pingback_ranks)
+    for pos, rank in refs_ranks.items():
+        rank_by_pos.setdefault(pos, len(expanded) + rank)
+    positions = list(rank_by_pos)
+
+    # an expansion at BFS level l puts its posts into every graph of depth > l
+    level_by_pos = {p: levels[rank] + 1 for p, rank in refs_ranks.items()}
+    for p, rank in pingback_ranks.items():
+        level_by_pos[p] = min(level_by_pos.get(p, d), levels[rank] + 1)
+
+    reached_via = [
+        "both" if p in pingback_ranks and p in refs_ranks else "pingback" if p in pingback_ranks else "refs"
+        for p in positions
+    ]
+    post_df = df.iloc[positions].assign(
+        reached_via=reached_via,
+        level=[level_by_pos[p] for p in positions],
+    )
+    comment_rows = _gather_comment_rows(index, positions, list(rank_by_pos.values()))
+    comment_df = comments.iloc[comment_rows].drop_duplicates(subset="_id")
+    comment_df = comment_df.assign(
+        level=comment_df["postId"].map(dict(zip(post_df["_id"], post_df["level"]))).to_numpy(dtype=np.int64)
+    )
+
     post_authors = post_df.explode("authors")["authors"].unique()
     post_user_df = user_df[user_df["display_name"].isin(post_authors)]
     comment_user_df = user_df[user_df["user_id"].isin(comment_df["author_id"].unique())]
     relevant_user_df = pd.concat([post_user_df, comment_user_df])
     relevant_user_df = relevant_user_df.drop_duplicates(subset="user_id")
-    return post_df, comment_df, relevant_user_df
+    return post_df, comment_df, relevant_user_df, truncated
 
 def unescape_and_strip_html(text):
     if text is None:
         return ""
     return html.unescape(re.sub(r'<[^>]*>', '', str(text))).strip()
 
-def build_graph(df, comments, post_id, user_df, depth=2):
-    post_df, comment_df, relevant_user_df = get_graph_dfs(df, comments, post_id, user_df, d=depth)
-    nodes = []
-    edges = []
-    # create post nodes
-    # print("Step 1/5: Creating post nodes")
-    for i, row in tqdm.tqdm(post_df.iterrows(), total=post_df.shape[0]):
-        nodes.append({
-            "id": row["_id"],
-            "label": row["title"],
-            "type": "post",
-            "sizeKarma": row["dot_size_karma"],
-            "sizeComments": row["dot_size_comments"],
-            "sizeUpvotes": row["dot_size_upvotes"],
-            "upvoteCount": row["upvoteCount"],
-            "karma": row["karma"],
-            "commentCount": row["commentCount"],
-            "url": row["url"]
-        })
-    # print("Step 2/5: Creating refs edges")
-    for i, row in tqdm.tqdm(post_df.iterrows(), total=post_df.shape[0]):
-        for ref in row["refs"]:
-            edges.append({
-                "source": row["_id"],
-                "target": ref,
-                "label": "refs"
-            })
-    # print("Step 3/7: Creating author nodes")
-    # for i, row in tqdm.tqdm(relevant_user_df.iterrows(), total=relevant_user_df.shape[0]):
-    #     nodes.append({
-    #         "id": row["user_id"],
-    #         "label": row["display_name"],
-    #         "type": "user",
-    #         "post_count": row["post_count"],
-    #         "comment_count": row["comment_count"],
-    #         "size": row["dot_size"],
-    #         "karma": row["karma"],
-    #         "url": "https://lesswrong.com/users/" + row["slug"]
-    #     })
-    # print("Step 4/7: Creating authorship edges")
-    # for i, row in tqdm.tqdm(post_df.iterrows(), total=post_df.shape[0]):
-    #     for author in row["authors"]:
-    #         try:
-    #             uid = relevant_user_df[relevant_user_df["display_name"] == author]["user_id"].values[0]
-    #             edges.append({
-    #                 "source": uid,
-    #                 "target": row["_id"],
-    #                 "label": "wrote",
-    #             })
-    #         except IndexError:
-    #             continue
-    # print("Step 5/7: Creating comment nodes")
-    for i, row in tqdm.tqdm(comment_df.iterrows(), total=comment_df.shape[0]):
-        nodes.append({
-            "id": row["_id"],
-            "label": unescape_and_strip_html(row["htmlBody"]),
-            "type": "comment",
-            "url": "https://lesswrong.com/posts/" + row["postId"] + "/comments/" + row["_id"],
-            # "upvoteCount": row["upvoteCount"]
-        })
-    # print("Step 6/7: Creating comment reply edges")
-    for i, row in tqdm.tqdm(comment_df.iterrows(), total=comment_df.shape[0]):
-        if row["parentCommentId"] is not None:
-            edges.append({
-                "source": row["_id"],
-                "target": row["parentCommentId"],
-                "label": "replyTo"
-            })
+def strip_html_series(texts):
+    """Vectorized `unescape_and_strip_html` over a Series; missing values become ""."""
+    stripped = texts.astype(object).where(texts.notna(), "").astype(str)
+    stripped = stripped.str.replace(r'<[^>]*>', '', regex=True)
+    return stripped.map(html.unescape).str.strip()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def load_comment_labels(comments, cache_path=None, source_path=None):
+    """Return plain-text labels for `comments["htmlBody"]`, aligned with `comments`.
+
+    Stripping the HTML of the whole comment dump is slow, so when `cache_path`
+    is given the labels are kept there as an `_id`/`plain_text` sidecar. It is
+    reused while it still lines up with `comments` and, when `source_path` is
+    given, was built from that file as it is now (same size and mtime), so
+    edited comment bodies are picked up. The sidecar is replaced atomically,
+    as other processes may be reading it.
+    """
+    signature = _file_signature(source_path).encode() if source_path is not None else b""
+
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            cached = pq.read_table(cache_path)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Ignoring unreadable comment label cache {cache_path}: {e}")
         else:
-            edges.append({
-                "source": row["_id"],
-                "target": row["postId"],
-                "label": "commentOn"
-            })
-    # print("Step 7/7: Creating authored comment edges")
-    for i, row in tqdm.tqdm(comment_df.iterrows(), total=comment_df.shape[0]):
-        edges.append({
-            "source": row["author_id"],
-            "target": row["_id"],
-            "label": "authored"
-        })
+            metadata = cached.schema.metadata or {}
+            if metadata.get(b"source_signature", b"") == signature:
+                cached = cached.to_pandas()
+                if cached["_id"].equals(comments["_id"].reset_index(drop=True)):
+                    return cached["plain_text"].to_numpy()
+
+    labels = strip_html_series(comments["htmlBody"])
+    if cache_path is not None:
+        table = pa.table({
+            "_id": comments["_id"].to_numpy(),
+            "plain_text": labels.to_numpy(),
+        }).replace_schema_metadata({b"source_signature": signature})
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Failed to write comment label cache {cache_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return labels.to_numpy()
+
+def _list_lengths(values):
+    return np.fromiter(
+        (len(v) if isinstance(v, (list, tuple, np.ndarray)) else 0 for v in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+
+def build_graph(df, comments, post_id, user_df, depth=2, index=None, with_levels=False):
+    """Build the node and edge dicts for the depth-`depth` graph around `post_id`.
+
+    With `with_levels`, every node and edge also carries a "level" key (see
+    `get_graph_dfs`), so the result can be cut down to any shallower depth
+    with `filter_graph_to_depth` instead of being recomputed.
+    """
+    post_df, comment_df, _ = get_graph_dfs(df, comments, post_id, user_df, d=depth, index=index)
+    return _graph_from_dfs(post_df, comment_df, with_levels)
+
+def build_budgeted_graph(df, comments, post_id, user_df, depth=2, max_nodes=1000, index=None, with_levels=False):
+    """`build_graph` capped at roughly `max_nodes` posts plus comments.
+
+    The neighbourhood is expanded in priority order until the budget is
+    reached (see `expand_post_positions_budgeted`). Returns `(nodes, edges,
+    truncated)`, where `truncated` says whether anything was left out.
+    """
+    post_df, comment_df, _, truncated = _get_graph_dfs(df, comments, post_id, user_df, depth, index, max_nodes)
+    nodes, edges = _graph_from_dfs(post_df, comment_df, with_levels)
+    return nodes, edges, truncated
+
+def _graph_from_dfs(post_df, comment_df, with_levels=False):
+    # create post nodes
+    post_nodes = pd.DataFrame({
+        "id": post_df["_id"],
+        "label": post_df["title"],
+        "type": "post",
+        "sizeKarma": post_df["dot_size_karma"],
+        "sizeComments": post_df["dot_size_comments"],
+        "sizeUpvotes": post_df["dot_size_upvotes"],
+        "upvoteCount": post_df["upvoteCount"],
+        "karma": post_df["karma"],
+        "commentCount": post_df["commentCount"],
+        "url": post_df["url"],
+    })
+
+    # refs edges: one row per (post, ref); posts without refs explode to a
+    # single placeholder row which is masked out
+    ref_lengths = _list_lengths(post_df["refs"].to_numpy())
+    exploded = post_df[["_id", "refs", "level"]].explode("refs")
+    exploded = exploded[np.repeat(ref_lengths > 0, np.maximum(ref_lengths, 1))]
+    ref_edges = pd.DataFrame({
+        "source": exploded["_id"].to_numpy(),
+        "target": exploded["refs"].to_numpy(),
+        "label": "refs",
+    })
+
+    # author nodes and authorship edges are currently disabled
+
+    # comment nodes
+    comment_ids = comment_df["_id"]
+    comment_nodes = pd.DataFrame({
+        "id": comment_ids,
+        "label": comment_df["plain_text"] if "plain_text" in comment_df else strip_html_series(comment_df["htmlBody"]),
+        "type": "comment",
+        "url": "https://lesswrong.com/posts/" + comment_df["postId"] + "/comments/" + comment_ids,
+    })
+
+    # comment reply edges, falling back to the post for top-level comments
+    has_parent = comment_df["parentCommentId"].notna().to_numpy()
+    reply_edges = pd.DataFrame({
+        "source": comment_ids.to_numpy(),
+        "target": np.where(has_parent, comment_df["parentCommentId"].to_numpy(), comment_df["postId"].to_numpy()),
+        "label": np.where(has_parent, "replyTo", "commentOn"),
+    })
+
+    # authored comment edges
+    authored_edges = pd.DataFrame({
+        "source": comment_df["author_id"].to_numpy(),
+        "target": comment_ids.to_numpy(),
+        "label": "authored",
+    })
+
+    if with_levels:
+        post_nodes["level"] = post_df["level"]
+        ref_edges["level"] = exploded["level"].to_numpy()
+        comment_nodes["level"] = comment_df["level"]
+        reply_edges["level"] = comment_df["level"].to_numpy()
+        authored_edges["level"] = comment_df["level"].to_numpy()
+
+    nodes = post_nodes.to_dict(orient="records") + comment_nodes.to_dict(orient="records")
+    edges = (
+        ref_edges.to_dict(orient="records")
+        + reply_edges.to_dict(orient="records")
+        + authored_edges.to_dict(orient="records")
+    )
     return nodes, edges
+
+def filter_graph_to_depth(nodes, edges, depth):
+    """Cut a graph built with `with_levels=True` down to `depth`."""
+    return (
+        [node for node in nodes if node["level"] <= depth],
+        [edge for edge in edges if edge["level"] <= depth],
+    )
@@ -14,7 +14,8 @@ from enpoints import (endpoint_author_similarity_score,
                       endpoint_dataframe, endpoint_get_articles,
                       endpoint_get_authors, endpoint_get_content,
                       endpoint_similarity_score, endpoint_specter_clustering)
-from utils import create_approach, list_approaches, send_feedback_email
+from utils import (create_approach, get_connected_posts_cache_status,
+                   get_pool_status, list_approaches, send_feedback_email)
 
 app = Flask(__name__)
 
@@ -35,6 +36,157 @@ def db_upgrade():
 def is_array_empty(array):
     return array is None or len(array) == 0
 
+COMPACT_GRAPH_MIMETYPE = 'application/vnd.nae.graph-compact+json'
+
+def wants_compact_graph(args, accept_mimetypes):
+    """Compact graph responses are opt-in via ?format=compact or the Accept header."""
+    if args.get('format') == 'compact':
+        return True
+    return accept_mimetypes.best == COMPACT_GRAPH_MIMETYPE
+
+# Request parsing and response shaping shared with the async routes in asgi.py.
+# `args` is a werkzeug MultiDict; the *_args helpers raise ValueError with the
+# message for a 400 response.
+
+# Budgeted graphs are stored per budget, so `maxNodes` is rounded down to one
+# of these to keep the number of stored rows bounded
+MAX_NODES_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def max_nodes_bucket(max_nodes):
+    """The largest bucket within `max_nodes`; never more than the client asked for."""
+    fitting = [bucket for bucket in MAX_NODES_BUCKETS if bucket <= max_nodes]
+    if not fitting:
+        raise ValueError(f"maxNodes must be at least {MAX_NODES_BUCKETS[0]}")
+    return fitting[-1]
+
+def connected_posts_args(args):
+    depth = int(args.get('depth'))
+    a_name = args.get('a_name')
+    if not a_name:
+        raise ValueError("a_name is required")
+    
+    # Optional cap on posts + comments; the response then carries `truncated`
+    max_nodes = args.get('maxNodes', type=int)
+
+    if max_nodes is not None:
+        max_nodes = max_nodes_bucket(max_nodes)
+
+    return a_name, depth, max_nodes
+
+def connected_comments_args(args):
+    depth = int(args.get('depth'))
+    a_name = args.get('a_name')
+    
+    # Paginated when `limit` is given; pass back `nextCursor` as `cursor`
+    limit = args.get('limit', type=int)
+    cursor = args.get('cursor', default=0, type=int)
+
+    if limit is not None and limit <= 0:
+        raise ValueError("limit must be a positive integer")
+
+    return a_name, depth, limit, cursor
+
+def list_approaches_args(args):
+    """Positional arguments for utils.list_approaches."""
+    limit = args.get('limit', default=10, type=int)
+    last_spotlight_count = args.get('lastSpotlightCount', type=int)
+    last_created_at = args.get('lastCreatedAt')
+    last_id = args.get('lastId', type=int)
+    last_comment_count = args.get('lastCommentCount', type=int)
+    filter_type = args.get('filter')
+    order_by = args.get('orderBy', default='spotlights')
+    # Caps how many spotlights are inlined per approach; all of them when omitted
+    spotlight_limit = args.get('spotlightLimit', type=int)
+
+    if filter_type not in [None, 'post', 'comment']:
+        raise ValueError("Invalid filter type. Use 'post', 'comment', or omit for both.")
+
+    if order_by not in ['spotlights', 'comments', 'recency']:
+        raise ValueError("Invalid order_by. Use 'spotlights', 'comments', or 'recency'.")
+
+    if spotlight_limit is not None and spotlight_limit < 0:
+        raise ValueError("spotlightLimit must be a non-negative integer")
+
+    if last_created_at:
+        last_created_at = datetime.fromisoformat(last_created_at)
+
+    return (limit, last_spotlight_count, last_created_at, last_id, filter_type, order_by, spotlight_limit,
+            last_comment_count)
+
+def approaches_response(page, order_by):
+    approaches, next_spotlight_count, next_created_at, next_id, next_comment_count = page
+    approaches_list = [
+        {
+            "id": approach[0],
+            "main_article": approach[1],
+            "node_id": approach[2],
+            "link": approach[3],
+            "type": approach[4],
+            "label": approach[5],
+            "created_at": approach[6].isoformat(),
+            "spotlight_count": approach[7],
+            "spotlights": [
+                {
+                    "email": spotlight[0],
+                    "comment": spotlight[1],
+                    "created_at": spotlight[2].isoformat()
+                }
+                for spotlight in approach[9]
+            ]
+        }
+        for approach in approaches
+    ]
+
+    # Each ordering pages on its own keyset: (count, createdAt, id) or (createdAt, id)
+    next_params = {}
+    if next_id is not None:
+        next_params = {
+            'lastCreatedAt': next_created_at.isoformat() if next_created_at else None,
+            'lastId': next_id
+        }
+        if order_by == 'spotlights':
+            next_params['lastSpotlightCount'] = next_spotlight_count
+        elif order_by == 'comments':
+            next_params['lastCommentCount'] = next_comment_count
+
+    return {
+        "approaches": approaches_list,
+        "nextParams": next_params
+    }
+
+def create_approach_args(data):
+    """Arguments for utils.create_approach from the POST /api/approaches body."""
+    main_article = data.get('mainArticle')
+    node_id = data.get('nodeId')
+    link = data.get('link')
+    type = data.get('type')
+    label = data.get('label')
+    comment = data.get('comment')
+    email = data.get('email')
+
+    if not node_id or not link:
+        raise ValueError("Node ID and link are required")
+
+    return main_article, node_id, link, type, label, email, comment
+
+def create_approach_response(approach_id, new_count, is_spotlight):
+    return {
+        "success": True, 
+        "message": "Approach spotlighted successfully" if is_spotlight else "Approach shared successfully",
+        "id": approach_id,
+        "spotlight_count": new_count
+    }
+
+def feedback_args(data):
+    name = data.get('name')
+    email = data.get('email')
+    feedback = data.get('feedback')
+
+    if not all([name, email, feedback]):
+        raise ValueError("Name, email, and feedback are required")
+
+    return name, email, feedback
+
 @app.route('/api/authors', methods=['GET'])
 def get_authors():
     return jsonify({
@@ -103,108 +255,59 @@ def get_specter_clustering():
 
 @app.route('/api/connected-posts', methods=['GET'])
 def get_connected_posts():
-    depth = int(request.args.get('depth'))
-    a_name = request.args.get('a_name')
-    
-    result = endpoint_connected_posts(a_name, depth)
+    try:
+        a_name, depth, max_nodes = connected_posts_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = endpoint_connected_posts(
+        a_name, depth, compact=wants_compact_graph(request.args, request.accept_mimetypes), max_nodes=max_nodes
+    )
     return jsonify(result)
 
 @app.route('/api/connected-comments', methods=['GET'])
 def get_connected_comments():
-    depth = int(request.args.get('depth'))
-    a_name = request.args.get('a_name')
-    
-    result = endpoint_connected_comments(a_name, depth)
-    return jsonify(result)
-
-@app.route('/api/approaches', methods=['GET'])
-def get_approaches():
-    limit = request.args.get('limit', default=10, type=int)
-    last_spotlight_count = request.args.get('lastSpotlightCount', type=int)
-    last_created_at = request.args.get('lastCreatedAt')
-    last_id = request.args.get('lastId', type=int)
-    filter_type = request.args.get('filter')
-    order_by = request.args.get('orderBy', default='spotlights')
-
-    if filter_type not in [None, 'post', 'comment']:
-        return jsonify({"error": "Invalid filter type. Use 'post', 'comment', or omit for both."}), 400
+    try:
+        a_name, depth, limit, cursor = connected_comments_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if order_by not in ['spotlights', 'comments', 'recency']:
-        return jsonify({"error": "Invalid order_by. Use 'spotlights', 'comments', or 'recency'."}), 400
+    result = endpoint_connected_comments(a_name, depth, limit, cursor)
+    return jsonify(result)
 
-    if last_created_at:
-        last_created_at = datetime.fromisoformat(last_created_at)
+@app.route('/api/internal/cache', methods=['GET'])
+def get_cache_status():
+    return jsonify(get_connected_posts_cache_status())
 
-    approaches, next_spotlight_count, next_created_at, next_id = list_approaches(
-        limit, last_spotlight_count, last_created_at, last_id, filter_type, order_by
-    )
-    approaches_list = [
-        {
-            "id": approach[0],
-            "main_article": approach[1],
-            "node_id": approach[2],
-            "link": approach[3],
-            "type": approach[4],
-            "label": approach[5],
-            "created_at": approach[6].isoformat(),
-            "spotlight_count": approach[7],
-            "spotlights": [
-                {
-                    "email": spotlight[0],
-                    "comment": spotlight[1],
-                    "created_at": spotlight[2].isoformat()
-                }
-                for spotlight in approach[9]
-            ]
-        }
-        for approach in approaches
-    ]
+@app.route('/api/internal/pool', methods=['GET'])
+def get_db_pool_status():
+    return jsonify(get_pool_status())
 
-    next_params = {}
-    if next_spotlight_count is not None:
-        next_params = {
-            'lastSpotlightCount': next_spotlight_count,
-            'lastCreatedAt': next_created_at.isoformat() if next_created_at else None,
-            'lastId': next_id
-        }
+@app.route('/api/approaches', methods=['GET'])
+def get_approaches():
+    try:
+        args = list_approaches_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify({
-        "approaches": approaches_list,
-        "nextParams": next_params
-    })
+    order_by = args[5]
+    return jsonify(approaches_response(list_approaches(*args), order_by))
 
 @app.route('/api/approaches', methods=['POST'])
 def create_new_approach():
-    data = request.json
-    main_article = data.get('mainArticle')
-    node_id = data.get('nodeId')
-    link = data.get('link')
-    type = data.get('type')
-    label = data.get('label')
-    comment = data.get('comment')
-    email = data.get('email')
+    try:
+        args = create_approach_args(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if not node_id or not link:
-        return jsonify({"error": "Node ID and link are required"}), 400
-
-    approach_id, new_count, is_spotlight = create_approach(main_article, node_id, link, type, label, email, comment)
-    
-    return jsonify({
-        "success": True, 
-        "message": "Approach spotlighted successfully" if is_spotlight else "Approach shared successfully",
-        "id": approach_id,
-        "spotlight_count": new_count
-    }), 201
+    return jsonify(create_approach_response(*create_approach(*args))), 201
 
 @app.route('/api/send-feedback', methods=['POST'])
 def send_feedback():
-    data = request.json
-    name = data.get('name')
-    email = data.get('email')
-    feedback = data.get('feedback')
-
-    if not all([name, email, feedback]):
-        return jsonify({"error": "Name, email, and feedback are required"}), 400
+    try:
+        name, email, feedback = feedback_args(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     success = send_feedback_email(name, email, feedback)
 
@@ -0,0 +1,45 @@
+"""create_graph_nodes_table
+
+Revision ID: 0a1d75dc8721
+Revises: e3b7602d3745
+Create Date: 2026-10-18 11:48:05.913264
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+# revision identifiers, used by Alembic.
+revision: str = '0a1d75dc8721'
+down_revision: Union[str, None] = 'e3b7602d3745'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # One row per post/comment node, shared by every graph that contains it
+    op.create_table('graph_nodes',
+        sa.Column('id', sa.Text(), nullable=False),
+        sa.Column('type', sa.Text(), nullable=False),
+        sa.Column('data', JSONB(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Normalised connected_posts rows keep only node ids (plus per-graph levels)
+    # and compact edges indexed into post_ids
+    op.add_column('connected_posts', sa.Column('post_ids', ARRAY(sa.Text()), nullable=True))
+    op.add_column('connected_posts', sa.Column('comment_ids', ARRAY(sa.Text()), nullable=True))
+    op.add_column('connected_posts', sa.Column('post_levels', ARRAY(sa.Integer()), nullable=True))
+    op.add_column('connected_posts', sa.Column('comment_levels', ARRAY(sa.Integer()), nullable=True))
+
+def downgrade():
+    op.execute('DELETE FROM connected_posts WHERE post_ids IS NOT NULL')
+
+    op.drop_column('connected_posts', 'comment_levels')
+    op.drop_column('connected_posts', 'post_levels')
+    op.drop_column('connected_posts', 'comment_ids')
+    op.drop_column('connected_posts', 'post_ids')
+
+    op.drop_table('graph_nodes')
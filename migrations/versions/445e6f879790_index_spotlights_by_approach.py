@@ -0,0 +1,25 @@
+"""index_spotlights_by_approach
+
+Revision ID: 445e6f879790
+Revises: 0a1d75dc8721
+Create Date: 2026-10-18 13:05:41.118402
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '445e6f879790'
+down_revision: Union[str, None] = '0a1d75dc8721'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Serves the batched newest-first spotlight lookup in list_approaches
+    op.create_index('ix_spotlights_approach_id_created_at', 'spotlights',
+                    ['approach_id', sa.text('created_at DESC')])
+
+def downgrade():
+    op.drop_index('ix_spotlights_approach_id_created_at', table_name='spotlights')
@@ -0,0 +1,30 @@
+"""add_connected_posts_requests
+
+Revision ID: 47a5ad8e977d
+Revises: a0f30818bb81
+Create Date: 2026-10-18 15:27:44.861032
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '47a5ad8e977d'
+down_revision: Union[str, None] = 'a0f30818bb81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Running /api/connected-posts request counts, used to order population work
+    op.create_table('connected_posts_requests',
+        sa.Column('a_name', sa.Text(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('request_count', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('last_requested_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.PrimaryKeyConstraint('a_name', 'depth')
+    )
+
+def downgrade():
+    op.drop_table('connected_posts_requests')
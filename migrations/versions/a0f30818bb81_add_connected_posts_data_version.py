@@ -0,0 +1,25 @@
+"""add_connected_posts_data_version
+
+Revision ID: a0f30818bb81
+Revises: c666fa80d022
+Create Date: 2026-10-18 14:52:31.204417
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a0f30818bb81'
+down_revision: Union[str, None] = 'c666fa80d022'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Fingerprint of the dataset a graph was built from; NULL for rows written
+    # before it was tracked, which population treats as stale
+    op.add_column('connected_posts', sa.Column('data_version', sa.Text(), nullable=True))
+
+def downgrade():
+    op.drop_column('connected_posts', 'data_version')
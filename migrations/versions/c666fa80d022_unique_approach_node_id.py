@@ -0,0 +1,60 @@
+"""unique_approach_node_id
+
+Revision ID: c666fa80d022
+Revises: eec7bbb16231
+Create Date: 2026-10-18 14:20:09.417736
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c666fa80d022'
+down_revision: Union[str, None] = 'eec7bbb16231'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Merge approaches duplicated by the old check-then-insert race into the oldest row
+    op.execute(
+        """
+        UPDATE spotlights s
+        SET approach_id = d.keep_id
+        FROM (
+            SELECT id, MIN(id) OVER (PARTITION BY node_id) AS keep_id
+            FROM approaches
+            WHERE node_id IS NOT NULL
+        ) d
+        WHERE s.approach_id = d.id AND d.id <> d.keep_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE approaches a
+        SET spotlight_count = d.spotlight_count,
+            comment_count = d.comment_count
+        FROM (
+            SELECT MIN(id) AS keep_id, SUM(spotlight_count) AS spotlight_count, SUM(comment_count) AS comment_count
+            FROM approaches
+            WHERE node_id IS NOT NULL
+            GROUP BY node_id
+            HAVING COUNT(*) > 1
+        ) d
+        WHERE a.id = d.keep_id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM approaches a
+        USING approaches b
+        WHERE a.node_id = b.node_id AND a.id > b.id
+        """
+    )
+
+    # ON CONFLICT (node_id) target for create_approach
+    op.create_index('ix_approaches_node_id', 'approaches', ['node_id'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_approaches_node_id', table_name='approaches')
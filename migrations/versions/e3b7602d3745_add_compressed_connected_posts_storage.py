@@ -0,0 +1,56 @@
+"""add_compressed_connected_posts_storage
+
+Revision ID: e3b7602d3745
+Revises: fbcdf9a6211e
+Create Date: 2026-10-18 11:02:17.284530
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7602d3745'
+down_revision: Union[str, None] = 'fbcdf9a6211e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # No query looks inside the JSONB columns, so the GIN indexes only cost writes and space
+    op.execute('DROP INDEX IF EXISTS ix_connected_posts_post_nodes')
+    op.execute('DROP INDEX IF EXISTS ix_connected_posts_comment_nodes')
+    op.execute('DROP INDEX IF EXISTS ix_connected_posts_edges')
+
+    # zstd-compressed JSON: graph_blob holds post_nodes + edges, comments_blob the comment nodes
+    op.add_column('connected_posts', sa.Column('graph_blob', sa.LargeBinary(), nullable=True))
+    op.add_column('connected_posts', sa.Column('comments_blob', sa.LargeBinary(), nullable=True))
+    op.add_column('connected_posts', sa.Column('post_count', sa.Integer(), nullable=True))
+    op.add_column('connected_posts', sa.Column('comment_count', sa.Integer(), nullable=True))
+    op.add_column('connected_posts', sa.Column('edge_count', sa.Integer(), nullable=True))
+
+    # Compressed rows leave the JSONB columns empty
+    op.alter_column('connected_posts', 'post_nodes', nullable=True)
+    op.alter_column('connected_posts', 'comment_nodes', nullable=True)
+    op.alter_column('connected_posts', 'edges', nullable=True)
+
+    # Blobs are already compressed; skip TOAST's own pglz pass
+    op.execute('ALTER TABLE connected_posts ALTER COLUMN graph_blob SET STORAGE EXTERNAL')
+    op.execute('ALTER TABLE connected_posts ALTER COLUMN comments_blob SET STORAGE EXTERNAL')
+
+def downgrade():
+    op.execute('DELETE FROM connected_posts WHERE graph_blob IS NOT NULL')
+
+    op.alter_column('connected_posts', 'edges', nullable=False)
+    op.alter_column('connected_posts', 'comment_nodes', nullable=False)
+    op.alter_column('connected_posts', 'post_nodes', nullable=False)
+
+    op.drop_column('connected_posts', 'edge_count')
+    op.drop_column('connected_posts', 'comment_count')
+    op.drop_column('connected_posts', 'post_count')
+    op.drop_column('connected_posts', 'comments_blob')
+    op.drop_column('connected_posts', 'graph_blob')
+
+    op.execute('CREATE INDEX ix_connected_posts_post_nodes ON connected_posts USING GIN (post_nodes)')
+    op.execute('CREATE INDEX ix_connected_posts_comment_nodes ON connected_posts USING GIN (comment_nodes)')
+    op.execute('CREATE INDEX ix_connected_posts_edges ON connected_posts USING GIN (edges)')
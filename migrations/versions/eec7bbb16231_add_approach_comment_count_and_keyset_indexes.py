@@ -0,0 +1,71 @@
+"""add_approach_comment_count_and_keyset_indexes
+
+Revision ID: eec7bbb16231
+Revises: 445e6f879790
+Create Date: 2026-10-18 13:41:27.650913
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'eec7bbb16231'
+down_revision: Union[str, None] = '445e6f879790'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, columns) for every list_approaches ordering, with and without the type filter
+KEYSET_INDEXES = [
+    ('ix_approaches_spotlights', ['spotlight_count', 'created_at', 'id']),
+    ('ix_approaches_comments', ['comment_count', 'created_at', 'id']),
+    ('ix_approaches_recency', ['created_at', 'id']),
+    ('ix_approaches_type_spotlights', ['type', 'spotlight_count', 'created_at', 'id']),
+    ('ix_approaches_type_comments', ['type', 'comment_count', 'created_at', 'id']),
+    ('ix_approaches_type_recency', ['type', 'created_at', 'id']),
+]
+
+def upgrade():
+    # Denormalised count of spotlights with a comment, maintained by create_approach
+    op.add_column('approaches', sa.Column('comment_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.execute(
+        """
+        UPDATE approaches a
+        SET comment_count = s.comment_count
+        FROM (
+            SELECT approach_id, COUNT(*) AS comment_count
+            FROM spotlights
+            WHERE comment IS NOT NULL
+            GROUP BY approach_id
+        ) s
+        WHERE s.approach_id = a.id
+        """
+    )
+
+    # Keyset comparisons drop NULL rows, so no keyset column can be NULL; an
+    # undated approach takes the date of its first spotlight, or now
+    op.execute('UPDATE approaches SET spotlight_count = 0 WHERE spotlight_count IS NULL')
+    op.alter_column('approaches', 'spotlight_count', nullable=False)
+    op.execute(
+        """
+        UPDATE approaches a
+        SET created_at = COALESCE(
+            (SELECT MIN(s.created_at) FROM spotlights s WHERE s.approach_id = a.id),
+            CURRENT_TIMESTAMP
+        )
+        WHERE a.created_at IS NULL
+        """
+    )
+    op.alter_column('approaches', 'created_at', nullable=False)
+
+    for name, columns in KEYSET_INDEXES:
+        op.create_index(name, 'approaches', columns)
+
+def downgrade():
+    for name, _ in reversed(KEYSET_INDEXES):
+        op.drop_index(name, table_name='approaches')
+
+    op.alter_column('approaches', 'created_at', nullable=True)
+    op.alter_column('approaches', 'spotlight_count', nullable=True)
+    op.drop_column('approaches', 'comment_count')
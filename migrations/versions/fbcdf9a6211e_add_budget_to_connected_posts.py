@@ -0,0 +1,33 @@
+"""add_budget_to_connected_posts
+
+Revision ID: fbcdf9a6211e
+Revises: f8ea1450b956
+Create Date: 2026-10-18 10:12:41.503117
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'fbcdf9a6211e'
+down_revision: Union[str, None] = 'f8ea1450b956'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Budgeted graphs are cached next to the full ones; max_nodes = 0 is the full graph
+    op.add_column('connected_posts', sa.Column('max_nodes', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('connected_posts', sa.Column('truncated', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    op.drop_constraint('connected_posts_a_name_depth_key', 'connected_posts', type_='unique')
+    op.create_unique_constraint('connected_posts_a_name_depth_max_nodes_key', 'connected_posts', ['a_name', 'depth', 'max_nodes'])
+
+def downgrade():
+    op.execute('DELETE FROM connected_posts WHERE max_nodes <> 0')
+    op.drop_constraint('connected_posts_a_name_depth_max_nodes_key', 'connected_posts', type_='unique')
+    op.create_unique_constraint('connected_posts_a_name_depth_key', 'connected_posts', ['a_name', 'depth'])
+
+    op.drop_column('connected_posts', 'truncated')
+    op.drop_column('connected_posts', 'max_nodes')
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pytest
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_dataset(n_posts=400, n_comments=6000, seed=0):
+    """A small synthetic stand-in for lw_data / lw_comments / users.
+
+    Posts link to random other posts (and now and then to an id that isn't in
+    the dataset), pingbacks mirror the refs, and comments hang off random
+    posts with ~60% of them replying to an earlier comment.
+    """
+    rng = np.random.default_rng(seed)
+    ids = [f"p{i:05d}" for i in range(n_posts)]
+
+    refs = []
+    for i in range(n_posts):
+        linked = list(rng.choice(ids, size=rng.integers(0, 6)))
+        if rng.random() < 0.1:
+            linked.append(f"missing{i}")
+        refs.append(np.array(linked, dtype=object))
+    pingback = [[] for _ in range(n_posts)]
+    for i, linked in enumerate(refs):
+        for target in linked:
+            if target.startswith("p"):
+                pingback[int(target[1:])].append(ids[i])
+
+    df = pd.DataFrame({
+        "_id": ids,
+        "title": [f" Title {i} " for i in range(n_posts)],
+        "refs": refs,
+        "pingback": [np.array(p, dtype=object) for p in pingback],
+        "karma": rng.integers(-5, 500, n_posts),
+        "upvoteCount": rng.integers(0, 300, n_posts),
+        "commentCount": rng.integers(0, 100, n_posts),
+        "url": [f"https://lesswrong.com/posts/p{i:05d}" for i in range(n_posts)],
+        "authors": [np.array([f"a{i % 7}"], dtype=object) for i in range(n_posts)],
+    })
+    for column, name in [("karma", "karma"), ("commentCount", "comments"), ("upvoteCount", "upvotes")]:
+        df["dot_size_" + name] = df[column] * 1.5
+
+    comment_ids = [f"c{i:06d}" for i in range(n_comments)]
+    comments = pd.DataFrame({
+        "_id": comment_ids,
+        "postId": rng.choice(ids, size=n_comments),
+        "parentCommentId": [
+            None if i == 0 or rng.random() < 0.4 else comment_ids[rng.integers(0, i)]
+            for i in range(n_comments)
+        ],
+        "htmlBody": [None if i % 97 == 0 else f"<p>Hello &amp; <b>w{i}</b></p> " for i in range(n_comments)],
+        "author_id": [f"u{i % 13}" for i in range(n_comments)],
+        "karma": rng.integers(-3, 80, n_comments),
+    })
+
+    users = pd.DataFrame({"user_id": [f"u{i}" for i in range(13)], "display_name": [f"a{i}" for i in range(13)]})
+    return df, comments, users
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    return make_dataset()
+
+
+@pytest.fixture
+def db_kwargs():
+    """libpq parameters for the configured database; skips the test without one."""
+    import utils
+
+    try:
+        kwargs = utils.db_connect_kwargs()
+        psycopg2.connect(**kwargs).close()
+    except Exception as e:
+        pytest.skip(f"no database: {e}")
+    return kwargs
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import psycopg2
+import pytest
+
+import utils
+
+ORDERINGS = list(utils.APPROACH_ORDERINGS)
+CURSOR_FIELDS = {
+    'spotlights': ('last_spotlight_count', 'last_created_at', 'last_id'),
+    'comments': ('last_comment_count', 'last_created_at', 'last_id'),
+    'recency': ('last_created_at', 'last_id'),
+}
+
+
+def query(limit=10, cursor=None, filter_type=None, order_by='spotlights'):
+    cursor = cursor or {}
+    return utils._list_approaches_query(
+        limit, cursor.get('last_spotlight_count'), cursor.get('last_created_at'), cursor.get('last_id'),
+        filter_type, order_by, cursor.get('last_comment_count'),
+    )
+
+def next_cursor(page):
+    _, spotlight_count, created_at, approach_id, comment_count = page
+    if approach_id is None:
+        return None
+    return {
+        'last_spotlight_count': spotlight_count,
+        'last_created_at': created_at,
+        'last_id': approach_id,
+        'last_comment_count': comment_count,
+    }
+
+
+@pytest.mark.parametrize("order_by", ORDERINGS)
+def test_keyset_condition_matches_the_sort_columns(order_by):
+    columns = utils.APPROACH_ORDERINGS[order_by]
+    cursor = {'last_spotlight_count': 3, 'last_comment_count': 2, 'last_created_at': datetime(2024, 1, 1), 'last_id': 9}
+
+    sql, params = query(5, cursor, 'post', order_by)
+
+    assert f"({', '.join(columns)}) < (" in sql
+    assert "ORDER BY " + ", ".join(f"{column} DESC" for column in columns) in sql
+    assert params == ('post', *(cursor[field] for field in CURSOR_FIELDS[order_by]), 6)
+
+def test_unknown_ordering_falls_back_to_spotlights():
+    assert query(order_by='nope') == query(order_by='spotlights')
+
+def test_partial_cursor_starts_from_the_top():
+    sql, params = query(5, {'last_created_at': datetime(2024, 1, 1)}, order_by='spotlights')
+    assert "<" not in sql and params == (6,)
+
+
+@pytest.fixture
+def db_cursor(db_kwargs):
+    """A cursor in a transaction that is rolled back, with ties on every sort key."""
+    conn = psycopg2.connect(**db_kwargs)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'approaches' AND column_name = 'comment_count'")
+        if cur.fetchone() is None:
+            pytest.skip("approaches table is not migrated")
+
+        base = datetime(2024, 1, 1)
+        cur.executemany(
+            "INSERT INTO approaches (link, type, label, created_at, spotlight_count, comment_count) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [
+                (f"keyset-test-{i}", 'post' if i % 3 else 'comment', f"approach {i}",
+                 base + timedelta(days=i % 11), i % 5, i % 4)
+                for i in range(300)
+            ],
+        )
+        cur.execute("ANALYZE approaches")
+        yield cur
+    finally:
+        conn.rollback()
+        conn.close()
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+@pytest.mark.parametrize("filter_type", [None, 'post'])
+@pytest.mark.parametrize("order_by", ORDERINGS)
+def test_pages_walk_the_full_ordering(db_cursor, order_by, filter_type):
+    columns = utils.APPROACH_ORDERINGS[order_by]
+    where = "WHERE a.type = %s" if filter_type else ""
+    db_cursor.execute(
+        f"SELECT a.id FROM approaches a {where} ORDER BY {', '.join(f'{c} DESC' for c in columns)}",
+        (filter_type,) if filter_type else (),
+    )
+    expected = [row[0] for row in db_cursor.fetchall()]
+
+    # Enough pages for the test rows; a database with more approaches is
+    # checked on this prefix of its ordering
+    seen = []
+    cursor = None
+    for _ in range(60):
+        db_cursor.execute(*query(7, cursor, filter_type, order_by))
+        page = utils._approaches_page(db_cursor.fetchall(), 7, defaultdict(list))
+        seen.extend(approach[0] for approach in page[0])
+        cursor = next_cursor(page)
+        if cursor is None:
+            assert len(seen) == len(expected)
+            break
+
+    assert seen == expected[:len(seen)]
+
+@pytest.mark.parametrize("filter_type", [None, 'post'])
+@pytest.mark.parametrize("order_by", ORDERINGS)
+@pytest.mark.parametrize("first_page", [True, False])
+def test_every_page_is_an_index_range_scan(db_cursor, order_by, filter_type, first_page):
+    cursor = None
+    if not first_page:
+        db_cursor.execute(*query(7, None, filter_type, order_by))
+        cursor = next_cursor(utils._approaches_page(db_cursor.fetchall(), 7, defaultdict(list)))
+
+    # Rule out the sequential scan + sort the small test table would get anyway
+    db_cursor.execute("SET LOCAL enable_seqscan = off")
+    db_cursor.execute("SET LOCAL enable_sort = off")
+    sql, params = query(7, cursor, filter_type, order_by)
+    db_cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    nodes = list(plan_nodes(db_cursor.fetchone()[0][0]['Plan']))
+
+    # With the type filter either the (type, ...) index or, when the type is
+    # common, the plain one filtered on type keeps the rows in order
+    indexes = {f"ix_approaches_{order_by}"}
+    if filter_type:
+        indexes.add(f"ix_approaches_type_{order_by}")
+    assert not [node for node in nodes if node['Node Type'] == 'Sort']
+    assert any(node.get('Index Name') in indexes for node in nodes)
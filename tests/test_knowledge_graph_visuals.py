@@ -0,0 +1,181 @@
+import json
+
+import pandas as pd
+import pytest
+
+from knowledge_graph_visuals import (build_budgeted_graph, build_graph,
+                                     build_graph_index, estimate_graph_nodes,
+                                     filter_graph_to_depth,
+                                     load_comment_labels,
+                                     unescape_and_strip_html)
+
+# The row-wise graph builder as it was before the CSR index and the columnar
+# node/edge emission, kept as the reference the fast path must match.
+
+def _baseline_post_centroid(df, comments, post_id, pingback=True):
+    main_post = df[df["_id"] == post_id]
+    key = "pingback" if pingback else "refs"
+    if len(main_post[key].values) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+    linked_posts = df[df["_id"].isin(main_post[key].values[0])]
+    new_df = pd.concat([main_post, linked_posts])
+    relevant_comments = comments[comments["postId"].isin(new_df["_id"].unique())]
+    return new_df, relevant_comments
+
+def _baseline_refs_tree(df, comments, post_id, depth=1, pingback=True):
+    queue = [post_id]
+    visited = set()
+    refs = []
+    comms = []
+
+    for _ in range(depth):
+        new_queue = []
+        for current_post_id in queue:
+            if current_post_id in visited:
+                continue
+            visited.add(current_post_id)
+
+            post_df, comm_df = _baseline_post_centroid(df, comments, current_post_id, pingback=pingback)
+            if post_df.empty:
+                continue
+
+            refs.append(post_df)
+            comms.append(comm_df)
+            new_queue.extend(post_df["pingback"].values[0])
+            new_queue.extend(post_df["refs"].values[0])
+
+        queue = new_queue
+
+    return pd.concat(refs).drop_duplicates(subset="_id"), pd.concat(comms).drop_duplicates(subset="_id")
+
+def baseline_build_graph(df, comments, post_id, depth=2):
+    pingback_df, pingback_comment_df = _baseline_refs_tree(df, comments, post_id, depth, pingback=True)
+    ref_df, ref_comment_df = _baseline_refs_tree(df, comments, post_id, depth, pingback=False)
+    post_df = pd.concat([pingback_df, ref_df]).drop_duplicates(subset="_id")
+    comment_df = pd.concat([pingback_comment_df, ref_comment_df]).drop_duplicates(subset="_id")
+
+    nodes = []
+    edges = []
+    for _, row in post_df.iterrows():
+        nodes.append({
+            "id": row["_id"],
+            "label": row["title"],
+            "type": "post",
+            "sizeKarma": row["dot_size_karma"],
+            "sizeComments": row["dot_size_comments"],
+            "sizeUpvotes": row["dot_size_upvotes"],
+            "upvoteCount": row["upvoteCount"],
+            "karma": row["karma"],
+            "commentCount": row["commentCount"],
+            "url": row["url"]
+        })
+    for _, row in post_df.iterrows():
+        for ref in row["refs"]:
+            edges.append({"source": row["_id"], "target": ref, "label": "refs"})
+    for _, row in comment_df.iterrows():
+        nodes.append({
+            "id": row["_id"],
+            "label": unescape_and_strip_html(row["htmlBody"]),
+            "type": "comment",
+            "url": "https://lesswrong.com/posts/" + row["postId"] + "/comments/" + row["_id"],
+        })
+    for _, row in comment_df.iterrows():
+        if row["parentCommentId"] is not None:
+            edges.append({"source": row["_id"], "target": row["parentCommentId"], "label": "replyTo"})
+        else:
+            edges.append({"source": row["_id"], "target": row["postId"], "label": "commentOn"})
+    for _, row in comment_df.iterrows():
+        edges.append({"source": row["author_id"], "target": row["_id"], "label": "authored"})
+    return nodes, edges
+
+
+@pytest.fixture(scope="module")
+def graph_index(dataset):
+    df, comments, _ = dataset
+    return build_graph_index(df, comments)
+
+
+@pytest.mark.parametrize("post_id", ["p00000", "p00010", "p00123", "p00399"])
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_build_graph_matches_row_wise_baseline(dataset, graph_index, post_id, depth):
+    df, comments, users = dataset
+
+    expected = baseline_build_graph(df, comments, post_id, depth=depth)
+    actual = build_graph(df, comments, post_id, users, depth=depth, index=graph_index)
+
+    assert actual == expected
+    # Same values *and* the same JSON-visible types
+    assert json.dumps(actual) == json.dumps(expected, default=int)
+
+def test_build_graph_unknown_post_is_empty(dataset, graph_index):
+    df, comments, users = dataset
+    assert build_graph(df, comments, "nope", users, index=graph_index) == ([], [])
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_levelled_graph_filters_to_shallower_depth(dataset, graph_index, depth):
+    df, comments, users = dataset
+
+    nodes, edges = build_graph(df, comments, "p00123", users, depth=3, index=graph_index, with_levels=True)
+    filtered = filter_graph_to_depth(nodes, edges, depth)
+    expected = build_graph(df, comments, "p00123", users, depth=depth, index=graph_index)
+
+    # Same rows; the filtered graph keeps the deeper graph's order
+    def rows(items):
+        return sorted(json.dumps({k: v for k, v in item.items() if k != "level"}, sort_keys=True) for item in items)
+
+    assert list(map(rows, filtered)) == list(map(rows, expected))
+
+@pytest.mark.parametrize("max_nodes", [1, 10**6])
+def test_budgeted_graph_truncated_flag_is_a_plain_bool(dataset, graph_index, max_nodes):
+    # 1: even the start post is over budget; 10**6: the whole graph fits
+    df, comments, users = dataset
+
+    nodes, edges, truncated = build_budgeted_graph(
+        df, comments, "p00123", users, depth=2, max_nodes=max_nodes, index=graph_index
+    )
+
+    assert type(truncated) is bool
+    assert truncated == (max_nodes == 1)
+    json.dumps({"nodes": nodes, "edges": edges, "truncated": truncated})
+
+
+def test_comment_label_cache_follows_source_edits(tmp_path):
+    source = tmp_path / "lw_comments.parquet"
+    cache = tmp_path / "lw_comments_plain_text.parquet"
+
+    comments = pd.DataFrame({"_id": ["c1", "c2"], "htmlBody": ["<p>old</p>", None]})
+    comments.to_parquet(source)
+    assert list(load_comment_labels(comments, str(cache), source_path=str(source))) == ["old", ""]
+    assert list(load_comment_labels(comments, str(cache), source_path=str(source))) == ["old", ""]
+
+    # Same ids, edited body
+    comments = pd.DataFrame({"_id": ["c1", "c2"], "htmlBody": ["<p>new &amp; improved</p>", None]})
+    comments.to_parquet(source)
+    assert list(load_comment_labels(comments, str(cache), source_path=str(source))) == ["new & improved", ""]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([cache.name, source.name])
+
+def test_comment_label_cache_rebuilds_unreadable_sidecar(tmp_path):
+    cache = tmp_path / "lw_comments_plain_text.parquet"
+    cache.write_bytes(b"PAR1 half-written")
+
+    comments = pd.DataFrame({"_id": ["c1"], "htmlBody": ["<b>hi</b>"]})
+    assert list(load_comment_labels(comments, str(cache))) == ["hi"]
+    assert list(load_comment_labels(comments, str(cache))) == ["hi"]
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_graph_fits_budget_exactly_when_estimate_does(dataset, graph_index, depth):
+    # The endpoints serve the full graph row whenever the estimate fits the budget
+    df, comments, users = dataset
+
+    for post_id in ["p00000", "p00010", "p00123", "p00200", "p00399"]:
+        nodes, _ = build_graph(df, comments, post_id, users, depth=depth, index=graph_index)
+        estimate = estimate_graph_nodes(graph_index, post_id, depth)
+        assert estimate == len(nodes)
+
+        for max_nodes in [estimate - 1, estimate]:
+            budgeted, _, truncated = build_budgeted_graph(
+                df, comments, post_id, users, depth=depth, max_nodes=max_nodes, index=graph_index
+            )
+            assert truncated == (max_nodes < estimate)
+            if not truncated:
+                assert sorted(node["id"] for node in budgeted) == sorted(node["id"] for node in nodes)
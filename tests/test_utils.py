@@ -0,0 +1,130 @@
+import pytest
+from psycopg2.extensions import adapt
+
+import utils
+from knowledge_graph_visuals import build_budgeted_graph, build_graph_index
+
+
+@pytest.mark.parametrize("storage", [None, "zstd", "normalized"])
+def test_budgeted_graph_that_fits_can_be_stored(dataset, storage):
+    df, comments, users = dataset
+    nodes, edges, truncated = build_budgeted_graph(
+        df, comments, "p00123", users, depth=2, max_nodes=10**6, index=build_graph_index(df, comments)
+    )
+
+    params, graph_nodes = utils._connected_posts_params(
+        "Title 123", 2, {"nodes": nodes, "edges": edges, "truncated": truncated},
+        compact=False, max_nodes=10**6, storage=storage,
+    )
+
+    for param in params:
+        adapt(param).getquoted()
+    utils.connected_posts_copy_row("Title 123", 2, {"nodes": nodes, "edges": edges, "truncated": truncated},
+                                   max_nodes=10**6, storage=storage)
+
+
+@pytest.fixture
+def request_counts(monkeypatch):
+    monkeypatch.setattr(utils, "request_counts", utils.Counter())
+    # As if this process's flush thread were already running
+    monkeypatch.setattr(utils, "request_counts_flusher_pid", utils.os.getpid())
+    return utils.request_counts
+
+def test_counting_a_request_never_touches_the_database(request_counts, monkeypatch):
+    def connect(**kwargs):
+        raise AssertionError("counting must not connect")
+
+    monkeypatch.setattr(utils.psycopg2, "connect", connect)
+    utils.record_connected_posts_request(None, 2)
+    utils.record_connected_posts_request("a", 2)
+    utils.record_connected_posts_request("a", 2)
+
+    assert request_counts == {("a", 2): 2}
+
+def test_flush_writes_sorted_counts(request_counts, monkeypatch):
+    executed = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def execute(self, sql, params):
+            executed.append(params)
+
+    class Connection(Cursor):
+        def cursor(self):
+            return Cursor()
+        def close(self):
+            pass
+
+    monkeypatch.setattr(utils.psycopg2, "connect", lambda **kwargs: Connection())
+    request_counts[("b", 2)] += 2
+    request_counts[("a", 1)] += 1
+
+    utils.flush_request_counts()
+    utils.flush_request_counts()
+
+    assert executed == [(["a", "b"], [1, 2], [1, 2])]
+    assert not request_counts
+
+def test_failed_flush_is_dropped_not_raised(request_counts, monkeypatch):
+    def unavailable(**kwargs):
+        raise utils.psycopg2.OperationalError("database is down")
+
+    monkeypatch.setattr(utils.psycopg2, "connect", unavailable)
+    request_counts[("a", 2)] += 1
+
+    utils.flush_request_counts()
+    assert not request_counts
+
+def test_lazy_pool_starts_with_one_connection_and_no_budget_probe(monkeypatch):
+    def probe():
+        raise AssertionError("lazy pools must not open a connection to size themselves")
+
+    monkeypatch.setattr(utils, "_connection_budget", probe)
+    monkeypatch.setattr(utils, "DB_POOL_MAX", None)
+    monkeypatch.setattr(utils, "DB_POOL_MIN", None)
+    assert utils.db_pool_size() == (1, 10)
+
+def test_prewarmed_pool_takes_its_share_of_the_budget(monkeypatch):
+    monkeypatch.setattr(utils, "_connection_budget", lambda: 20)
+    monkeypatch.setattr(utils, "DB_POOL_MAX", None)
+    monkeypatch.setattr(utils, "DB_POOL_MIN", None)
+    assert utils.db_pool_size(workers=4, threads=8, prewarm=True) == (5, 5)
+    assert utils.db_pool_size(workers=1, threads=8, prewarm=True) == (9, 9)
+
+def test_cache_measures_graphs_outside_the_lock(monkeypatch):
+    monkeypatch.setattr(utils, "connected_posts_cache", utils._CountingTLRUCache(
+        maxsize=10**6, ttu=utils._until_next_utc_midnight, timer=utils.time.time, getsizeof=utils._entry_size,
+    ))
+    graph = {'nodes': [{'id': 'p1'}], 'edges': [], 'updated_at': '2024-01-01 00:00:00'}
+    measure = utils._graph_size
+
+    def unlocked_size(value):
+        assert not utils.connected_posts_cache_lock.locked()
+        return measure(value)
+
+    monkeypatch.setattr(utils, "_graph_size", unlocked_size)
+    utils._cache_store(("t", 2, 0), graph)
+
+    assert utils._cache_lookup(("t", 2, 0)) == graph
+    assert utils.connected_posts_cache.currsize == measure(graph)
+
+def test_refused_return_frees_the_pool_slot(db_kwargs, monkeypatch):
+    db_pool = utils.BlockingConnectionPool(0, 1, **db_kwargs)
+    try:
+        conn = db_pool.getconn()
+
+        def refuse(self, conn=None, key=None, close=False):
+            raise utils.pool.PoolError("connection pool is closed")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(utils.pool.ThreadedConnectionPool, "putconn", refuse)
+            with pytest.raises(utils.pool.PoolError):
+                db_pool.putconn(conn)
+
+        assert db_pool._slots.acquire(blocking=False)
+        conn.close()
+    finally:
+        db_pool.closeall()
@@ -1,13 +1,22 @@
+import bisect
+import hashlib
+import io
+import json
 import logging
 import os
+import sys
+import threading
 import time
+from collections import Counter, defaultdict
 from contextlib import contextmanager
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 from urllib.parse import urlparse
 
 import pandas as pd
 import psycopg2
+import zstandard
+from cachetools import TLRUCache
 from psycopg2 import pool
 from psycopg2.extras import Json
 from sendgrid import SendGridAPIClient
@@ -21,8 +30,205 @@ logger = logging.getLogger(__name__)
 # Define a global variable for the connection pool
 connection_pool: Optional[pool.SimpleConnectionPool] = None
 
-def initialize_db_pool():
-    """Initialize the connection pool if not already created."""
+def db_connect_kwargs():
+    """libpq connection parameters from DATABASE_URL (shared with async_utils)."""
+    db_url = os.getenv("DATABASE_URL") or os.getenv("DATABASE_PUBLIC_URL")
+    
+    if not db_url:
+        raise Exception("DATABASE URL is not set in the environment variables")
+        
+    result = urlparse(db_url)
+    
+    return {
+        'host': result.hostname,
+        'port': result.port,
+        'dbname': result.path[1:],
+        'user': result.username,
+        'password': result.password,
+        'connect_timeout': 5,
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 5,
+    }
+
+# Seconds a checkout waits for a connection to be returned before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Attempts at opening a connection when the server refuses or drops it
+DB_CONNECT_RETRIES = 3
+# Pool size overrides; by default db_pool_size derives them from how the process is served
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 0)) or None
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 0)) or None
+# Server connections left for migrations, population runs and psql sessions
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", 5))
+# Connections idle for longer than this are pinged before being handed out
+DB_PRE_PING_IDLE = float(os.getenv("DB_PRE_PING_IDLE", 30))
+
+# Upper bounds, in seconds, of the checkout wait and hold time histogram buckets
+POOL_HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class _Histogram:
+    """Prometheus-style cumulative histogram over POOL_HISTOGRAM_BUCKETS."""
+
+    def __init__(self):
+        self.counts = [0] * (len(POOL_HISTOGRAM_BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(POOL_HISTOGRAM_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def snapshot(self):
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(POOL_HISTOGRAM_BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': cumulative, 'sum_seconds': round(self.total, 6)}
+
+pool_metrics_lock = threading.Lock()
+pool_metrics = {
+    'checkouts': 0,
+    'exhausted': 0,  # checkouts that found every connection in use and had to wait
+    'timeouts': 0,   # ... and gave up after DB_POOL_TIMEOUT
+    'retries': 0,    # failed attempts at opening a connection
+    'waiting': 0,
+    'pings': 0,
+    'stale': 0,      # connections found closed or failing their ping, and replaced
+    'wait': _Histogram(),
+    'hold': defaultdict(_Histogram),  # keyed by the function that took the connection
+}
+
+def _count_pool_event(name, delta=1):
+    with pool_metrics_lock:
+        pool_metrics[name] += delta
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool whose getconn waits up to `timeout` seconds for a
+    connection to be returned instead of raising PoolError at maxconn, and
+    pings connections that sat idle past DB_PRE_PING_IDLE before handing
+    them out."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._returned_at = {}
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None, timeout=None):
+        if timeout is None:
+            timeout = DB_POOL_TIMEOUT
+        if not self._slots.acquire(blocking=False):
+            with pool_metrics_lock:
+                pool_metrics['exhausted'] += 1
+                pool_metrics['waiting'] += 1
+            try:
+                acquired = self._slots.acquire(timeout=timeout)
+            finally:
+                _count_pool_event('waiting', -1)
+            if not acquired:
+                _count_pool_event('timeouts')
+                raise pool.PoolError(f"connection pool exhausted: no connection returned within {timeout}s")
+        try:
+            return self._checkout(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkout(self, key):
+        while True:
+            conn = super().getconn(key)
+            idle = time.monotonic() - self._returned_at.pop(id(conn), time.monotonic())
+            if not conn.closed and idle < DB_PRE_PING_IDLE:
+                return conn
+            if not conn.closed and self._ping(conn):
+                return conn
+            _count_pool_event('stale')
+            super().putconn(conn, key, close=True)
+
+    def _connect(self, key=None):
+        # Covers the connections opened up front as well as those opened on demand
+        conn = super()._connect(key)
+        self._returned_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _ping(self, conn):
+        _count_pool_event('pings')
+        try:
+            # In autocommit the ping is a single round trip with no BEGIN/ROLLBACK
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    def putconn(self, conn=None, key=None, close=False):
+        # Stamped before it is back in the pool, where another thread can take it
+        self._returned_at[id(conn)] = time.monotonic()
+        try:
+            super().putconn(conn, key, close)
+            if conn.closed:
+                self._returned_at.pop(id(conn), None)
+        finally:
+            # Freed even when the pool refuses the connection (closed pool,
+            # unkeyed connection); a lost slot would never come back
+            self._release_slot()
+
+    def _release_slot(self):
+        try:
+            self._slots.release()
+        except ValueError:
+            pass  # more returns than checkouts: a connection this pool never handed out
+
+def _connection_budget():
+    """Connections the server accepts from this app, or None if it can't be asked."""
+    try:
+        conn = psycopg2.connect(**db_connect_kwargs())
+    except psycopg2.OperationalError as e:
+        logger.warning(f"Could not read max_connections, sizing the pool without it: {str(e)}")
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT current_setting('max_connections')::int"
+                " - current_setting('superuser_reserved_connections')::int"
+            )
+            return cur.fetchone()[0] - DB_RESERVED_CONNECTIONS
+    finally:
+        conn.close()
+
+def db_pool_size(workers=1, threads=9, prewarm=False):
+    """(minconn, maxconn) for one of `workers` processes serving `threads` requests at a time.
+
+    With `prewarm` (gunicorn workers), maxconn is a connection per request
+    thread plus a spare, capped at this process's share of the server's
+    max_connections, and every connection is opened up front unless
+    DB_POOL_MIN says otherwise; psycopg2 also closes connections returned
+    beyond minconn, so it is the number kept warm too. Other processes (the
+    population run, scripts, the dev server) get the original lazy 1-10 pool
+    and don't count against the worker shares. DB_POOL_MAX overrides maxconn.
+    """
+    maxconn = DB_POOL_MAX
+    if not prewarm:
+        maxconn = maxconn or threads + 1
+        return min(DB_POOL_MIN or 1, maxconn), maxconn
+
+    if maxconn is None:
+        maxconn = threads + 1
+        budget = _connection_budget()
+        if budget is not None:
+            maxconn = max(1, min(maxconn, budget // workers))
+    minconn = min(DB_POOL_MIN or maxconn, maxconn)
+    return minconn, maxconn
+
+def initialize_db_pool(workers=1, threads=9, prewarm=False):
+    """(Re)create the connection pool, sized by db_pool_size(workers, threads, prewarm).
+
+    gunicorn.conf.py calls this after fork with `prewarm` so the first request
+    finds warm connections; other processes get a lazy pool on their first
+    checkout.
+    """
     global connection_pool
     
     try:
@@ -33,54 +239,63 @@ def initialize_db_pool():
                 pass
             connection_pool = None
             
-        db_url = os.getenv("DATABASE_URL") or os.getenv("DATABASE_PUBLIC_URL")
-        
-        if not db_url:
-            raise Exception("DATABASE URL is not set in the environment variables")
-            
-        result = urlparse(db_url)
-        
-        connection_pool = pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10, 
-            host=result.hostname,
-            port=result.port,
-            database=result.path[1:],
-            user=result.username,
-            password=result.password,
-            connect_timeout=5,
-            keepalives=1,
-            keepalives_idle=30,
-            keepalives_interval=10,
-            keepalives_count=5
+        minconn, maxconn = db_pool_size(workers, threads, prewarm)
+        connection_pool = BlockingConnectionPool(
+            minconn=minconn,
+            maxconn=maxconn, 
+            **db_connect_kwargs()
         )
-        logger.info("Database connection pool initialized successfully")
+        logger.info(f"Database connection pool initialized successfully ({minconn}-{maxconn} connections)")
     except Exception as e:
         logger.error(f"Failed to initialize connection pool: {str(e)}")
         raise
 
+connection_pool_lock = threading.Lock()
+
+def _get_db_pool():
+    # Concurrent first checkouts must not each build (and close) their own pool
+    if connection_pool is None:
+        with connection_pool_lock:
+            if connection_pool is None:
+                initialize_db_pool()
+    return connection_pool
+
+def _calling_function():
+    # Two frames up from the generator body: contextlib's __enter__, then the caller
+    try:
+        frame = sys._getframe(3)
+    except ValueError:
+        return 'unknown'
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections."""
+    """Context manager for database connections.
+
+    Waits up to DB_POOL_TIMEOUT seconds for a free connection when the pool is
+    exhausted; only failures to open a connection are retried. Checkout wait
+    and hold times are recorded for get_pool_status.
+    """
+    caller = _calling_function()
     conn = None
-    max_retries = 3
-    retry_count = 0
+    started = time.perf_counter()
     
-    while retry_count < max_retries:
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
         try:
-            if connection_pool is None:
-                initialize_db_pool()
-            conn = connection_pool.getconn()
+            conn_pool = _get_db_pool()
+            conn = conn_pool.getconn()
             break
-        except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
-            retry_count += 1
-            logger.warning(f"Failed to get connection (attempt {retry_count}/{max_retries}): {str(e)}")
-            if retry_count == max_retries:
+        except psycopg2.OperationalError as e:
+            logger.warning(f"Failed to get connection (attempt {attempt}/{DB_CONNECT_RETRIES}): {str(e)}")
+            if attempt == DB_CONNECT_RETRIES:
                 raise
-            time.sleep(1)  # Longer sleep between retries
+            _count_pool_event('retries')
+            time.sleep(0.1 * 2 ** attempt)
     
-    if conn is None:
-        raise Exception("Failed to acquire database connection")
+    checked_out = time.perf_counter()
+    with pool_metrics_lock:
+        pool_metrics['checkouts'] += 1
+        pool_metrics['wait'].observe(checked_out - started)
         
     try:
         yield conn
@@ -91,15 +306,17 @@ def get_db_connection():
             conn.rollback()
         raise
     finally:
-        if conn is not None and not conn.closed:
+        with pool_metrics_lock:
+            pool_metrics['hold'][caller].observe(time.perf_counter() - checked_out)
+        try:
+            # Closed connections go back too, so the pool frees their slot
+            conn_pool.putconn(conn, close=bool(conn.closed))
+        except Exception as e:
+            logger.error(f"Error releasing connection: {str(e)}")
             try:
-                connection_pool.putconn(conn)
-            except Exception as e:
-                logger.error(f"Error releasing connection: {str(e)}")
-                try:
-                    conn.close()
-                except Exception:
-                    pass
+                conn.close()
+            except Exception:
+                pass
 
 def close_db_pool():
     """Close all connections in the pool."""
@@ -107,52 +324,56 @@ def close_db_pool():
     try:
         if connection_pool:
             connection_pool.closeall()
+            connection_pool = None
             logger.info("Database connection pool closed successfully")
     except Exception as e:
         logger.error(f"Error closing connection pool: {str(e)}")
         raise
 
-# Define the Idea model operations using psycopg2
+# Define the Idea model operations using psycopg2. The SQL and row handling
+# below are shared with the asyncio counterparts in async_utils.
+
+# xmax is only set on the conflict (update) path, so it tells an existing
+# approach from a freshly inserted one
+CREATE_APPROACH_SQL = """
+    WITH approach AS (
+        INSERT INTO approaches (main_article, node_id, link, type, label, created_at, spotlight_count, comment_count)
+        VALUES (%(main_article)s, %(node_id)s, %(link)s, %(type)s, %(label)s, %(now)s, 1, %(comment_increment)s)
+        ON CONFLICT (node_id) DO UPDATE
+        SET spotlight_count = approaches.spotlight_count + 1,
+            comment_count = approaches.comment_count + EXCLUDED.comment_count
+        RETURNING id, spotlight_count, xmax <> 0 AS existed
+    ), spotlight AS (
+        INSERT INTO spotlights (approach_id, email, comment, created_at)
+        SELECT id, %(email)s, %(comment)s, %(now)s
+        FROM approach
+        WHERE %(with_spotlight)s
+    )
+    SELECT id, spotlight_count, existed FROM approach
+"""
+
+def _create_approach_params(main_article, node_id, link, type, label, email, comment):
+    return {
+        'main_article': main_article, 'node_id': node_id, 'link': link, 'type': type,
+        'label': label, 'now': datetime.now(timezone.utc),
+        # approaches.comment_count mirrors the spotlights rows with a comment
+        'comment_increment': 1 if (email or comment) and comment is not None else 0,
+        'email': email, 'comment': comment, 'with_spotlight': bool(email or comment),
+    }
+
 def create_approach(main_article, node_id, link, type, label, email=None, comment=None):
-    existing_approach = get_approach_by_node_id(node_id)
-    
+    """Insert the approach for `node_id` or bump its spotlight count, in one statement.
+
+    The optional spotlight row is written by the same statement, so both
+    land or neither does. Returns (approach_id, spotlight_count, existed).
+    """
     with get_db_connection() as conn:
         cur = conn.cursor()
-        
-        if existing_approach:
-            approach_id = existing_approach[0]
-            cur.execute(
-                """
-                UPDATE approaches
-                SET spotlight_count = spotlight_count + 1
-                WHERE id = %s
-                RETURNING spotlight_count
-                """,
-                (approach_id,)
-            )
-            new_count = cur.fetchone()[0]
-        else:
-            cur.execute(
-                """
-                INSERT INTO approaches (main_article, node_id, link, type, label, created_at, spotlight_count)
-                VALUES (%s, %s, %s, %s, %s, %s, 1)
-                RETURNING id, spotlight_count
-                """,
-                (main_article, node_id, link, type, label, datetime.now(timezone.utc))
-            )
-            approach_id, new_count = cur.fetchone()
-        
-        if email or comment:
-            cur.execute(
-                """
-                INSERT INTO spotlights (approach_id, email, comment, created_at)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (approach_id, email, comment, datetime.now(timezone.utc))
-            )
-        
+        cur.execute(CREATE_APPROACH_SQL, _create_approach_params(main_article, node_id, link, type, label, email, comment))
+        approach_id, new_count, existed = cur.fetchone()
+
         cur.close()
-        return approach_id, new_count, existing_approach is not None
+        return approach_id, new_count, existed
 
 def get_approach_by_node_id(node_id):
     with get_db_connection() as conn:
@@ -169,83 +390,124 @@ def get_approach_by_node_id(node_id):
         cur.close()
         return approach
 
+# Newest-first spotlights for a list of approach ids; LIMIT NULL is no limit
+SPOTLIGHTS_SQL = """
+    SELECT a.id, s.email, s.comment, s.created_at
+    FROM unnest(%s::int[]) WITH ORDINALITY AS a(id, ord)
+    CROSS JOIN LATERAL (
+        SELECT email, comment, created_at
+        FROM spotlights
+        WHERE approach_id = a.id
+        ORDER BY created_at DESC
+        LIMIT %s
+    ) s
+    ORDER BY a.ord, s.created_at DESC
+"""
+
+def _group_spotlights(approach_ids, rows):
+    spotlights = {approach_id: [] for approach_id in approach_ids}
+    for approach_id, email, comment, created_at in rows:
+        spotlights[approach_id].append((email, comment, created_at))
+    return spotlights
+
+def _fetch_spotlights(cur, approach_ids, spotlight_limit=None):
+    """Newest-first spotlights for every id in `approach_ids`, in one query.
+
+    Returns {approach_id: [(email, comment, created_at), ...]}; with
+    `spotlight_limit` each approach gets at most that many.
+    """
+    if not approach_ids:
+        return {}
+    cur.execute(SPOTLIGHTS_SQL, (list(approach_ids), spotlight_limit))
+    return _group_spotlights(approach_ids, cur.fetchall())
+
 def get_spotlights_for_approach(approach_id):
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT email, comment, created_at
-            FROM spotlights
-            WHERE approach_id = %s
-            ORDER BY created_at DESC
-            """,
-            (approach_id,)
-        )
-        spotlights = cur.fetchall()
+        spotlights = _fetch_spotlights(cur, [approach_id])[approach_id]
         cur.close()
         return spotlights
 
-def list_approaches(limit=10, last_spotlight_count=None, last_created_at=None, last_id=None, filter_type=None, order_by='spotlights'):
-    with get_db_connection() as conn:
-        cur = conn.cursor()
+# Keyset columns per ordering, all sorted DESC; each has a matching
+# (type, ...) and plain composite index so pages are index range scans
+APPROACH_ORDERINGS = {
+    'spotlights': ('a.spotlight_count', 'a.created_at', 'a.id'),
+    'comments': ('a.comment_count', 'a.created_at', 'a.id'),
+    'recency': ('a.created_at', 'a.id'),
+}
 
-        where_clause = ""
-        order_clause = ""
-        params = []
-
-        if last_spotlight_count is not None and last_created_at and last_id:
-            where_clause = "WHERE (a.spotlight_count, a.created_at, a.id) < (%s, %s, %s)"
-            params.extend([last_spotlight_count, last_created_at, last_id])
-
-        if filter_type in ['post', 'comment']:
-            where_clause += " AND " if where_clause else "WHERE "
-            where_clause += "a.type = %s"
-            params.append(filter_type)
-
-        if order_by == 'spotlights':
-            order_clause = "ORDER BY a.spotlight_count DESC, a.created_at DESC, a.id DESC"
-        elif order_by == 'comments':
-            order_clause = "ORDER BY comment_count DESC, a.created_at DESC, a.id DESC"
-        elif order_by == 'recency':
-            order_clause = "ORDER BY a.created_at DESC, a.id DESC"
-        else:
-            order_clause = "ORDER BY a.spotlight_count DESC, a.created_at DESC, a.id DESC"
-
-        query = f"""
-            SELECT a.id, a.main_article, a.node_id, a.link, a.type, a.label, a.created_at, a.spotlight_count,
-                   COUNT(CASE WHEN s.comment IS NOT NULL THEN 1 END) as comment_count
-            FROM approaches a
-            LEFT JOIN spotlights s ON a.id = s.approach_id
-            {where_clause}
-            GROUP BY a.id
-            {order_clause}
-            LIMIT %s
-        """
-        params.append(limit + 1)
+def _list_approaches_query(limit, last_spotlight_count, last_created_at, last_id, filter_type, order_by, last_comment_count):
+    if order_by not in APPROACH_ORDERINGS:
+        order_by = 'spotlights'
+    columns = APPROACH_ORDERINGS[order_by]
 
-        cur.execute(query, tuple(params))
+    conditions = []
+    params = []
 
-        approaches = cur.fetchall()
-        cur.close()
+    if filter_type in ['post', 'comment']:
+        conditions.append("a.type = %s")
+        params.append(filter_type)
+
+    last_values = {
+        'spotlights': (last_spotlight_count, last_created_at, last_id),
+        'comments': (last_comment_count, last_created_at, last_id),
+        'recency': (last_created_at, last_id),
+    }[order_by]
+    if all(value is not None for value in last_values):
+        conditions.append(f"({', '.join(columns)}) < ({', '.join(['%s'] * len(columns))})")
+        params.extend(last_values)
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_clause = "ORDER BY " + ", ".join(f"{column} DESC" for column in columns)
+
+    query = f"""
+        SELECT a.id, a.main_article, a.node_id, a.link, a.type, a.label, a.created_at, a.spotlight_count,
+               a.comment_count
+        FROM approaches a
+        {where_clause}
+        {order_clause}
+        LIMIT %s
+    """
+    params.append(limit + 1)
+    return query, tuple(params)
 
-        has_next = len(approaches) > limit
-        approaches = approaches[:limit]
+def _approaches_page(approaches, limit, spotlights):
+    has_next = len(approaches) > limit
+    approaches = approaches[:limit]
+
+    next_spotlight_count = None
+    next_created_at = None
+    next_id = None
+    next_comment_count = None
+    if has_next and approaches:
+        last_approach = approaches[-1]
+        next_spotlight_count = last_approach[7]
+        next_created_at = last_approach[6]
+        next_id = last_approach[0]
+        next_comment_count = last_approach[8]
+
+    approaches_with_spotlights = [approach + (spotlights[approach[0]],) for approach in approaches]
+
+    return approaches_with_spotlights, next_spotlight_count, next_created_at, next_id, next_comment_count
+
+def list_approaches(limit=10, last_spotlight_count=None, last_created_at=None, last_id=None, filter_type=None, order_by='spotlights', spotlight_limit=None, last_comment_count=None):
+    """Return one page of approaches plus the keyset cursor for the next one.
+
+    The cursor is (next_spotlight_count, next_created_at, next_id,
+    next_comment_count); pass back the fields used by `order_by`.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
 
-        next_spotlight_count = None
-        next_created_at = None
-        next_id = None
-        if has_next and approaches:
-            last_approach = approaches[-1]
-            next_spotlight_count = last_approach[7]
-            next_created_at = last_approach[6]
-            next_id = last_approach[0]
+        cur.execute(*_list_approaches_query(
+            limit, last_spotlight_count, last_created_at, last_id, filter_type, order_by, last_comment_count
+        ))
+        approaches = cur.fetchall()
 
-        approaches_with_spotlights = []
-        for approach in approaches:
-            spotlights = get_spotlights_for_approach(approach[0])
-            approaches_with_spotlights.append(approach + (spotlights,))
+        spotlights = _fetch_spotlights(cur, [approach[0] for approach in approaches[:limit]], spotlight_limit)
+        cur.close()
 
-        return approaches_with_spotlights, next_spotlight_count, next_created_at, next_id
+        return _approaches_page(approaches, limit, spotlights)
 
 def string_list_to_list(strlist):
     return [c.strip("'").strip('"') for c in strlist.strip("[]").split(", ")]
@@ -275,70 +537,681 @@ def prepare_concept_for_request(c):
     c = c.replace("  ", " ")
     return c.strip().strip("/").strip()
 
-def get_connected_posts_from_db(a_name, depth):
+# Edge labels in the order used by the compact graph format's `type` column
+EDGE_TYPES = ['refs', 'replyTo', 'commentOn', 'authored']
+
+def compact_nodes(nodes):
+    """Encode a list of node dicts as one column list per key.
+
+    Keys missing from a node come back as None from `expand_nodes`.
+    """
+    keys = list(dict.fromkeys(key for node in nodes for key in node))
+    return {key: [node.get(key) for node in nodes] for key in keys}
+
+def expand_nodes(columns):
+    if not columns:
+        return []
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+def compact_edges(edges, node_ids):
+    """Encode edges as integer index columns into `node_ids` plus an edge-type enum.
+
+    Endpoints that are not in `node_ids` (authors, posts outside the graph)
+    are appended to an `ids` list and indexed after the nodes.
+    """
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+    extra_ids = []
+    edge_types = list(EDGE_TYPES)
+    type_position = {label: i for i, label in enumerate(edge_types)}
+
+    def index_of(node_id):
+        if node_id not in position:
+            position[node_id] = len(position)
+            extra_ids.append(node_id)
+        return position[node_id]
+
+    def type_of(label):
+        if label not in type_position:
+            type_position[label] = len(edge_types)
+            edge_types.append(label)
+        return type_position[label]
+
+    compact = {
+        'ids': extra_ids,
+        'types': edge_types,
+        'source': [index_of(edge['source']) for edge in edges],
+        'target': [index_of(edge['target']) for edge in edges],
+        'type': [type_of(edge['label']) for edge in edges],
+    }
+    if edges and 'level' in edges[0]:
+        compact['level'] = [edge['level'] for edge in edges]
+    return compact
+
+def expand_edges(compact, node_ids):
+    ids = list(node_ids) + compact['ids']
+    types = compact['types']
+    edges = [
+        {'source': ids[source], 'target': ids[target], 'label': types[edge_type]}
+        for source, target, edge_type in zip(compact['source'], compact['target'], compact['type'])
+    ]
+    for edge, level in zip(edges, compact.get('level', [])):
+        edge['level'] = level
+    return edges
+
+def compact_graph(nodes, edges):
+    """Compact wire format for a graph: a column-oriented node table and
+    edges as index pairs into it (see `compact_nodes`/`compact_edges`)."""
+    return {
+        'format': 'compact',
+        'nodes': compact_nodes(nodes),
+        'edges': compact_edges(edges, [node['id'] for node in nodes]),
+    }
+
+# 'jsonb' keeps graphs in the post_nodes/comment_nodes/edges columns, 'zstd'
+# stores them as compressed JSON in graph_blob/comments_blob, and 'normalized'
+# stores node ids per graph with the node data shared in graph_nodes
+CONNECTED_POSTS_STORAGE = os.getenv("CONNECTED_POSTS_STORAGE", "jsonb")
+ZSTD_LEVEL = 10
+
+def compress_json(value):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(json.dumps(value).encode())
+
+def decompress_json(blob):
+    return json.loads(zstandard.ZstdDecompressor().decompress(blob))
+
+# Shared node store for 'normalized' rows; one statement per graph, with ids
+# sorted so concurrent writers lock shared nodes in the same order
+UPSERT_GRAPH_NODES_SQL = """
+    INSERT INTO graph_nodes (id, type, data)
+    SELECT * FROM unnest(%s::text[], %s::text[], %s::jsonb[])
+    ON CONFLICT (id) DO UPDATE
+    SET type = EXCLUDED.type,
+        data = EXCLUDED.data,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE graph_nodes.data IS DISTINCT FROM EXCLUDED.data
+"""
+
+def _graph_node_columns(nodes, jsonb=Json):
+    rows = {node['id']: node for node in nodes}
+    ids = sorted(rows)
+    return (
+        ids,
+        [rows[node_id]['type'] for node_id in ids],
+        [jsonb({key: value for key, value in rows[node_id].items() if key != 'level'}) for node_id in ids],
+    )
+
+# Rebuilds node dicts for a normalised row in `ids` order, merging the
+# per-graph levels back in and dropping nodes deeper than `depth` if given
+HYDRATE_NODES_SQL = """
+    SELECT coalesce(json_agg(
+               CASE WHEN u.level IS NULL THEN n.data
+                    ELSE n.data || jsonb_build_object('level', u.level) END
+               ORDER BY u.ord), '[]')
+    FROM unnest(%(ids)s::text[], %(levels)s::int[]) WITH ORDINALITY AS u(id, level, ord)
+    JOIN graph_nodes n ON n.id = u.id
+    WHERE %(depth)s::int IS NULL OR u.level <= %(depth)s
+"""
+
+def _hydrate_params(ids, levels, stored_depth, depth):
+    """HYDRATE_NODES_SQL params, or None when the row can't serve `depth`."""
+    if stored_depth != depth and levels is None:
+        return None
+    return {'ids': list(ids), 'levels': levels, 'depth': depth if stored_depth != depth else None}
+
+def _has_levels(nodes):
+    return not nodes or 'level' in nodes[0]
+
+def _filter_to_depth(items, depth):
+    return [item for item in items if item['level'] <= depth]
+
+# Per-worker cache in front of get_connected_posts_from_db, bounded by the
+# serialised size of the cached graphs rather than by entry count
+CONNECTED_POSTS_CACHE_BYTES = int(os.getenv("CONNECTED_POSTS_CACHE_BYTES", 256 * 1024 * 1024))
+
+class _CountingTLRUCache(TLRUCache):
+    """TLRUCache that counts size-driven evictions."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+def _until_next_utc_midnight(key, value, now):
+    # endpoint_connected_posts treats rows as fresh for the UTC day they were written
+    today = datetime.fromtimestamp(now, timezone.utc).date()
+    midnight = datetime.combine(today + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return midnight.timestamp()
+
+def _graph_size(value):
+    return len(json.dumps(value, default=str))
+
+def _entry_size(entry):
+    return entry[1]
+
+# Entries are (graph, _graph_size(graph)); the size is measured before the
+# lock is taken, as serialising a large graph would hold up every lookup
+connected_posts_cache = _CountingTLRUCache(
+    maxsize=CONNECTED_POSTS_CACHE_BYTES,
+    ttu=_until_next_utc_midnight,
+    timer=time.time,
+    getsizeof=_entry_size,
+)
+connected_posts_cache_lock = threading.Lock()
+connected_posts_cache_stats = {'hits': 0, 'misses': 0}
+
+def invalidate_connected_posts_cache(a_name=None):
+    """Drop cached graphs for `a_name` (every depth and budget), or all of them."""
+    with connected_posts_cache_lock:
+        if a_name is None:
+            connected_posts_cache.clear()
+            return
+        for key in [key for key in connected_posts_cache if key[0] == a_name]:
+            connected_posts_cache.pop(key, None)
+
+def get_connected_posts_cache_status() -> dict[str, Any]:
+    with connected_posts_cache_lock:
+        return {
+            **connected_posts_cache_stats,
+            'evictions': connected_posts_cache.evictions,
+            'entries': len(connected_posts_cache),
+            'bytes': connected_posts_cache.currsize,
+            'max_bytes': connected_posts_cache.maxsize,
+        }
+
+def _cache_lookup(key):
+    with connected_posts_cache_lock:
+        cached = connected_posts_cache.get(key)
+        if cached is not None:
+            connected_posts_cache_stats['hits'] += 1
+            return dict(cached[0])
+        connected_posts_cache_stats['misses'] += 1
+        return None
+
+def _cache_store(key, db_result, size=None):
+    """Cache `db_result`; `size` is its `_graph_size` if the caller measured it already."""
+    if size is None:
+        size = _graph_size(db_result)
+    with connected_posts_cache_lock:
+        try:
+            connected_posts_cache[key] = (db_result, size)
+        except ValueError:
+            pass  # larger than the whole cache
+    return dict(db_result)
+
+def get_connected_posts_from_db(a_name, depth, max_nodes=0):
+    """Cached `fetch_connected_posts_from_db`; hits never touch the connection pool."""
+    key = (a_name, depth, max_nodes)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        return cached
+
+    db_result = fetch_connected_posts_from_db(a_name, depth, max_nodes)
+    if db_result is not None:
+        db_result = _cache_store(key, db_result)
+    return db_result
+
+CONNECTED_POSTS_SQL = """
+    SELECT depth, post_nodes, edges, graph_blob, updated_at, truncated,
+           post_ids, post_levels, comment_ids
+    FROM connected_posts
+    WHERE a_name = %(a_name)s AND max_nodes = %(max_nodes)s
+      AND depth >= %(depth)s AND (max_nodes = 0 OR depth = %(depth)s)
+    ORDER BY depth
+    LIMIT 1
+"""
+
+def _connected_posts_result(row, depth, max_nodes, hydrated_nodes=None):
+    """Decode a CONNECTED_POSTS_SQL row in any storage layout, or None if it can't serve `depth`.
+
+    Normalised rows need their post nodes from HYDRATE_NODES_SQL as `hydrated_nodes`.
+    """
+    stored_depth, post_nodes, edges, graph_blob, updated_at, truncated, post_ids, _, comment_ids = row
+    if post_ids is not None:
+        post_nodes = hydrated_nodes
+        edges = expand_edges(edges, post_ids + comment_ids)
+        if stored_depth != depth:
+            edges = _filter_to_depth(edges, depth)
+    else:
+        if graph_blob is not None:
+            graph = decompress_json(graph_blob)
+            post_nodes, edges = graph['post_nodes'], graph['edges']
+        if isinstance(post_nodes, dict):
+            post_nodes = expand_nodes(post_nodes)
+            edges = expand_edges(edges, [node['id'] for node in post_nodes])
+        if stored_depth != depth:
+            if not _has_levels(post_nodes):
+                return None
+            post_nodes = _filter_to_depth(post_nodes, depth)
+            edges = _filter_to_depth(edges, depth)
+    db_result = {
+        'nodes': post_nodes,
+        'edges': edges,
+        'updated_at': updated_at
+    }
+    if max_nodes:
+        db_result['truncated'] = truncated
+    return db_result
+
+def fetch_connected_posts_from_db(a_name, depth, max_nodes=0):
+    """Fetch the connected-posts graph for `a_name` at `depth`.
+
+    Graphs stored with level tags also serve every shallower depth, so the
+    shallowest stored row at or above `depth` is used and filtered down.
+    Budgeted graphs (`max_nodes` > 0) are separate rows and only match their
+    exact depth; their result carries a 'truncated' flag.
+    """
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT post_nodes, edges, updated_at
-            FROM connected_posts
-            WHERE a_name = %s AND depth = %s
-            """,
-            (a_name, depth)
-        )
-        result = cur.fetchone()
+        cur.execute(CONNECTED_POSTS_SQL, {'a_name': a_name, 'depth': depth, 'max_nodes': max_nodes})
+        row = cur.fetchone()
+
+        hydrated_nodes = None
+        if row and row[6] is not None:
+            params = _hydrate_params(row[6], row[7], row[0], depth)
+            if params is None:
+                cur.close()
+                return None
+            cur.execute(HYDRATE_NODES_SQL, params)
+            hydrated_nodes = cur.fetchone()[0]
         cur.close()
-        
-        if result:
-            post_nodes, edges, updated_at = result
-            return {
-                'nodes': post_nodes,
-                'edges': edges,
-                'updated_at': updated_at
-            }
+
+    if row is None:
         return None
+    return _connected_posts_result(row, depth, max_nodes, hydrated_nodes)
+
+# In the order of the _connected_posts_params tuple
+CONNECTED_POSTS_COLUMNS = """a_name, depth, max_nodes, truncated,
+                             post_count, comment_count, edge_count,
+                             post_nodes, comment_nodes, edges, graph_blob, comments_blob,
+                             post_ids, comment_ids, post_levels, comment_levels, data_version"""
+
+UPSERT_CONNECTED_POSTS = """
+    ON CONFLICT (a_name, depth, max_nodes) DO UPDATE
+    SET post_nodes = EXCLUDED.post_nodes,
+        comment_nodes = EXCLUDED.comment_nodes,
+        edges = EXCLUDED.edges,
+        graph_blob = EXCLUDED.graph_blob,
+        comments_blob = EXCLUDED.comments_blob,
+        post_ids = EXCLUDED.post_ids,
+        comment_ids = EXCLUDED.comment_ids,
+        post_levels = EXCLUDED.post_levels,
+        comment_levels = EXCLUDED.comment_levels,
+        post_count = EXCLUDED.post_count,
+        comment_count = EXCLUDED.comment_count,
+        edge_count = EXCLUDED.edge_count,
+        truncated = EXCLUDED.truncated,
+        data_version = EXCLUDED.data_version,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+SAVE_CONNECTED_POSTS_SQL = f"""
+    INSERT INTO connected_posts ({CONNECTED_POSTS_COLUMNS})
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""" + UPSERT_CONNECTED_POSTS
+
+# Per-session staging table for the COPY batch path; emptied by every commit
+CREATE_CONNECTED_POSTS_STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS connected_posts_staging ON COMMIT DELETE ROWS AS
+    SELECT {CONNECTED_POSTS_COLUMNS}
+    FROM connected_posts WITH NO DATA
+"""
+
+COPY_CONNECTED_POSTS_STAGING_SQL = f"COPY connected_posts_staging ({CONNECTED_POSTS_COLUMNS}) FROM STDIN"
+
+# A row can't be updated twice by one INSERT ... ON CONFLICT, so a graph
+# staged more than once in a batch keeps only its last copy
+MERGE_CONNECTED_POSTS_STAGING_SQL = f"""
+    INSERT INTO connected_posts ({CONNECTED_POSTS_COLUMNS})
+    SELECT DISTINCT ON (a_name, depth, max_nodes) {CONNECTED_POSTS_COLUMNS}
+    FROM connected_posts_staging
+    ORDER BY a_name, depth, max_nodes, ctid DESC
+""" + UPSERT_CONNECTED_POSTS
+
+def _connected_posts_params(a_name, depth, result, compact, max_nodes, storage, data_version=None, jsonb=Json, binary=psycopg2.Binary):
+    """SAVE_CONNECTED_POSTS_SQL params plus the UPSERT_GRAPH_NODES_SQL params (None unless normalised).
+
+    `jsonb` and `binary` wrap values for the calling driver.
+    """
+    post_nodes = [node for node in result['nodes'] if node['type'] == 'post']
+    comment_nodes = [node for node in result['nodes'] if node['type'] == 'comment']
+    edges = result['edges']
+    counts = (len(post_nodes), len(comment_nodes), len(edges))
+    normalized = (None, None, None, None)
+    graph_nodes = None
+
+    if storage == 'normalized':
+        graph_nodes = _graph_node_columns(post_nodes + comment_nodes, jsonb)
+        post_ids = [node['id'] for node in post_nodes]
+        comment_ids = [node['id'] for node in comment_nodes]
+        with_levels = all('level' in node for node in post_nodes + comment_nodes)
+        normalized = (
+            post_ids,
+            comment_ids,
+            [node['level'] for node in post_nodes] if with_levels else None,
+            [node['level'] for node in comment_nodes] if with_levels else None,
+        )
+        edges = compact_edges(edges, post_ids + comment_ids)
+    elif compact:
+        edges = compact_edges(edges, [node['id'] for node in post_nodes])
+        post_nodes = compact_nodes(post_nodes)
+        comment_nodes = compact_nodes(comment_nodes)
+
+    if storage == 'normalized':
+        columns = (None, None, jsonb(edges), None, None)
+    elif storage == 'zstd':
+        columns = (
+            None, None, None,
+            binary(compress_json({'post_nodes': post_nodes, 'edges': edges})),
+            binary(compress_json(comment_nodes)),
+        )
+    else:
+        columns = (jsonb(post_nodes), jsonb(comment_nodes), jsonb(edges), None, None)
+
+    params = (a_name, depth, max_nodes, result.get('truncated', False), *counts, *columns, *normalized, data_version)
+    return params, graph_nodes
+
+def save_connected_posts_to_db(a_name, depth, result, compact=False, max_nodes=0, storage=None, data_version=None):
+    """Upsert the graph for (`a_name`, `depth`, `max_nodes`).
+
+    With `compact`, nodes are stored as column tables and edges as index
+    pairs (see `compact_graph`); the readers expand either layout.
+    `max_nodes` is 0 for full graphs and the budget for budgeted ones.
+    `storage` overrides CONNECTED_POSTS_STORAGE ('jsonb', 'zstd' or
+    'normalized'); normalised rows always use compact edges indexed into
+    post_ids + comment_ids. `data_version` fingerprints the dataset the
+    graph was built from (see `data_files_version`).
+    """
+    params, graph_nodes = _connected_posts_params(
+        a_name, depth, result, compact, max_nodes, storage or CONNECTED_POSTS_STORAGE, data_version
+    )
 
-def save_connected_posts_to_db(a_name, depth, result):
     with get_db_connection() as conn:
         cur = conn.cursor()
-        
-        post_nodes = [node for node in result['nodes'] if node['type'] == 'post']
-        comment_nodes = [node for node in result['nodes'] if node['type'] == 'comment']
+        if graph_nodes is not None:
+            cur.execute(UPSERT_GRAPH_NODES_SQL, graph_nodes)
+        cur.execute(SAVE_CONNECTED_POSTS_SQL, params)
+        cur.close()
+
+    invalidate_connected_posts_cache(a_name)
+
+def _array_literal(values):
+    return '{' + ','.join(
+        'NULL' if value is None else '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+        for value in values
+    ) + '}'
 
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    if isinstance(value, list):
+        value = _array_literal(value)
+    # Chained replaces beat str.translate by an order of magnitude on multi-MB JSON
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+
+def connected_posts_copy_row(a_name, depth, result, compact=False, max_nodes=0, storage=None, data_version=None):
+    """(a_name, COPY text line, UPSERT_GRAPH_NODES_SQL params or None) for one graph.
+
+    Pure CPU work with no connection, so population workers can serialise
+    graphs in parallel and leave the writer only the COPY itself.
+    """
+    params, graph_nodes = _connected_posts_params(
+        a_name, depth, result, compact, max_nodes, storage or CONNECTED_POSTS_STORAGE, data_version,
+        jsonb=json.dumps, binary=bytes
+    )
+    return a_name, '\t'.join(_copy_value(value) for value in params) + '\n', graph_nodes
+
+def copy_connected_posts_to_db(rows):
+    """Write `connected_posts_copy_row` rows in one transaction.
+
+    The rows are streamed into a temporary staging table with COPY and
+    merged into connected_posts with a single upsert, and their graph nodes
+    go in with a single UPSERT_GRAPH_NODES_SQL.
+    """
+    graph_nodes = {}
+    for _, _, columns in rows:
+        if columns is not None:
+            graph_nodes.update(zip(columns[0], zip(columns[1], columns[2])))
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        # Rows are a rebuildable cache, so a crash may lose the last batch
+        # rather than every batch waiting on a WAL flush
+        cur.execute("SET LOCAL synchronous_commit = off")
+        if graph_nodes:
+            ids = sorted(graph_nodes)
+            cur.execute(UPSERT_GRAPH_NODES_SQL, (
+                ids, [graph_nodes[node_id][0] for node_id in ids], [graph_nodes[node_id][1] for node_id in ids]
+            ))
+        cur.execute(CREATE_CONNECTED_POSTS_STAGING_SQL)
+        cur.copy_expert(COPY_CONNECTED_POSTS_STAGING_SQL, io.StringIO(''.join(line for _, line, _ in rows)))
+        cur.execute(MERGE_CONNECTED_POSTS_STAGING_SQL)
+        cur.close()
+
+    for a_name in {a_name for a_name, _, _ in rows}:
+        invalidate_connected_posts_cache(a_name)
+
+def data_files_version(paths):
+    """Content fingerprint of the dataset files graphs are built from."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def get_current_connected_posts(depth, data_version):
+    """Titles whose full depth-`depth` graph is stored for `data_version`."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
         cur.execute(
-            """
-            INSERT INTO connected_posts (a_name, depth, post_nodes, comment_nodes, edges)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (a_name, depth) DO UPDATE
-            SET post_nodes = EXCLUDED.post_nodes,
-                comment_nodes = EXCLUDED.comment_nodes,
-                edges = EXCLUDED.edges,
-                updated_at = CURRENT_TIMESTAMP
-            """,
-            (a_name, depth, Json(post_nodes), Json(comment_nodes), Json(result['edges']))
+            "SELECT a_name FROM connected_posts WHERE depth = %s AND max_nodes = 0 AND data_version = %s",
+            (depth, data_version),
         )
-        
+        a_names = {row[0] for row in cur.fetchall()}
         cur.close()
+        return a_names
 
-def get_connected_comments_from_db(a_name, depth):
+# Request counts are buffered in memory and written out by a background thread
+# this often, so counting costs a request neither a round trip nor a connection
+REQUEST_COUNTS_FLUSH_SECONDS = float(os.getenv("REQUEST_COUNTS_FLUSH_SECONDS", 60))
+
+request_counts = Counter()
+request_counts_lock = threading.Lock()
+# The process the flush thread runs in; a forked worker starts its own
+request_counts_flusher_pid = None
+
+RECORD_REQUEST_COUNTS_SQL = """
+    INSERT INTO connected_posts_requests (a_name, depth, request_count)
+    SELECT * FROM unnest(%s::text[], %s::int[], %s::bigint[])
+    ON CONFLICT (a_name, depth) DO UPDATE
+    SET request_count = connected_posts_requests.request_count + EXCLUDED.request_count,
+        last_requested_at = CURRENT_TIMESTAMP
+"""
+
+def record_connected_posts_request(a_name, depth):
+    """Count a request for the population's demand ordering (see `flush_request_counts`)."""
+    global request_counts_flusher_pid
+
+    if a_name is None:
+        return
+
+    with request_counts_lock:
+        request_counts[(a_name, depth)] += 1
+        if request_counts_flusher_pid != os.getpid():
+            request_counts_flusher_pid = os.getpid()
+            threading.Thread(target=_flush_request_counts_forever, name="request-counts-flush", daemon=True).start()
+
+def _flush_request_counts_forever():
+    while True:
+        time.sleep(REQUEST_COUNTS_FLUSH_SECONDS)
+        flush_request_counts()
+
+def flush_request_counts():
+    """Add the buffered request counts to connected_posts_requests.
+
+    Runs on its own short-lived connection, outside the request pools.
+    Demand statistics are best effort: counts that fail to write are
+    logged and dropped.
+    """
+    with request_counts_lock:
+        counts = list(request_counts.items())
+        request_counts.clear()
+    if not counts:
+        return
+
+    # Sorted so concurrent flushes from several workers lock rows in the same order
+    counts.sort(key=lambda item: (str(item[0][0]), item[0][1]))
+    params = (
+        [a_name for (a_name, _), _ in counts],
+        [depth for (_, depth), _ in counts],
+        [count for _, count in counts],
+    )
+    try:
+        conn = psycopg2.connect(**db_connect_kwargs())
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(RECORD_REQUEST_COUNTS_SQL, params)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Failed to record connected-posts request counts: {str(e)}")
+
+def get_connected_posts_request_counts(depth):
+    """Requests per title that a stored depth-`depth` graph serves (every depth up to `depth`)."""
     with get_db_connection() as conn:
         cur = conn.cursor()
         cur.execute(
-            """
-            SELECT comment_nodes
-            FROM connected_posts
-            WHERE a_name = %s AND depth = %s
-            """,
-            (a_name, depth)
+            "SELECT a_name, SUM(request_count) FROM connected_posts_requests WHERE depth <= %s GROUP BY a_name",
+            (depth,),
         )
-        result = cur.fetchone()
+        counts = {a_name: int(count) for a_name, count in cur.fetchall()}
         cur.close()
-        
-        if result:
-            return {
-                'nodes': result[0]
-            }
+        return counts
+
+CONNECTED_COMMENTS_SQL = """
+    SELECT depth, comment_nodes, comments_blob, comment_ids, comment_levels
+    FROM connected_posts
+    WHERE a_name = %s AND depth >= %s AND max_nodes = 0
+    ORDER BY depth
+    LIMIT 1
+"""
+
+def _connected_comments_result(row, depth, hydrated_nodes=None):
+    """Decode a CONNECTED_COMMENTS_SQL row, or None if it can't serve `depth`."""
+    stored_depth, comment_nodes, comments_blob, comment_ids, _ = row
+    if comment_ids is not None:
+        comment_nodes = hydrated_nodes
+    else:
+        if comments_blob is not None:
+            comment_nodes = decompress_json(comments_blob)
+        if isinstance(comment_nodes, dict):
+            comment_nodes = expand_nodes(comment_nodes)
+        if stored_depth != depth:
+            if not _has_levels(comment_nodes):
+                return None
+            comment_nodes = _filter_to_depth(comment_nodes, depth)
+    return {
+        'nodes': comment_nodes
+    }
+
+def get_connected_comments_from_db(a_name, depth):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CONNECTED_COMMENTS_SQL, (a_name, depth))
+        row = cur.fetchone()
+
+        hydrated_nodes = None
+        if row and row[3] is not None:
+            params = _hydrate_params(row[3], row[4], row[0], depth)
+            if params is None:
+                cur.close()
+                return None
+            cur.execute(HYDRATE_NODES_SQL, params)
+            hydrated_nodes = cur.fetchone()[0]
+        cur.close()
+
+    if row is None:
         return None
+    return _connected_comments_result(row, depth, hydrated_nodes)
+
+COMMENTS_PAGE_SQL = """
+    SELECT c.depth, jsonb_typeof(c.comment_nodes),
+           COALESCE(c.comment_nodes->0 ? 'level', true),
+           e.node, e.ordinality
+    FROM (
+        SELECT depth, comment_nodes
+        FROM connected_posts
+        WHERE a_name = %(a_name)s AND depth >= %(depth)s AND max_nodes = 0
+        ORDER BY depth
+        LIMIT 1
+    ) c
+    LEFT JOIN LATERAL (
+        SELECT node, ordinality
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(c.comment_nodes) = 'array' THEN c.comment_nodes ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS e(node, ordinality)
+        WHERE ordinality > %(cursor)s
+          AND (c.depth = %(depth)s OR (node->>'level')::int <= %(depth)s)
+        ORDER BY ordinality
+        LIMIT %(limit)s
+    ) e ON true
+    ORDER BY e.ordinality
+"""
+
+# Returned by _comments_page for rows that have to be read whole and paged in Python
+NEEDS_FULL_READ = object()
+
+def _comments_page(rows, depth, limit):
+    if not rows:
+        return None
+
+    stored_depth, layout, has_levels = rows[0][:3]
+    if stored_depth != depth and not has_levels:
+        return None
+    if layout != 'array':
+        # compact, compressed and normalised rows can't be sliced in SQL
+        return NEEDS_FULL_READ
+
+    rows = [row for row in rows if row[3] is not None]
+    next_cursor = rows[limit - 1][4] if len(rows) > limit else None
+    return [row[3] for row in rows[:limit]], next_cursor
+
+def get_connected_comments_page_from_db(a_name, depth, limit, cursor=0):
+    """Fetch one page of comment nodes for (`a_name`, `depth`).
+
+    The JSONB array is sliced server-side, so only the requested page is
+    sent back and deserialised. `cursor` is the opaque position returned
+    with the previous page (0 for the first page). Returns
+    `(nodes, next_cursor)`, with `next_cursor` None on the last page, or None
+    when no usable row is stored.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(COMMENTS_PAGE_SQL, {'a_name': a_name, 'depth': depth, 'cursor': cursor, 'limit': limit + 1})
+        rows = cur.fetchall()
+        cur.close()
+
+    page = _comments_page(rows, depth, limit)
+    if page is NEEDS_FULL_READ:
+        db_result = get_connected_comments_from_db(a_name, depth)
+        if db_result is None:
+            return None
+        return page_nodes(db_result['nodes'], limit, cursor)
+    return page
+
+def page_nodes(nodes, limit, cursor=0):
+    """Python counterpart of the SQL slicing in `get_connected_comments_page_from_db`."""
+    page = nodes[cursor:cursor + limit]
+    next_cursor = cursor + limit if len(nodes) > cursor + limit else None
+    return page, next_cursor
 
 def send_feedback_email(name: str, email: str, feedback: str) -> bool:
     sendgrid_api_key = os.getenv("SENDGRID_API_KEY")
@@ -380,18 +1253,20 @@ def delete_meetup_posts():
         cur.execute("DELETE FROM connected_posts WHERE LOWER(a_name) LIKE LOWER('%meetup%')")
         cur.close()
 
+    invalidate_connected_posts_cache()
+
 def delete_all_connected_posts():
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("TRUNCATE TABLE connected_posts")
+        cur.execute("TRUNCATE TABLE connected_posts, graph_nodes")
         cur.execute("ALTER SEQUENCE IF EXISTS connected_posts_id_seq RESTART WITH 1")
         cur.close()
 
+    invalidate_connected_posts_cache()
+
     conn = None
     try:
-        if connection_pool is None:
-            initialize_db_pool()
-        conn = connection_pool.getconn()
+        conn = _get_db_pool().getconn()
         conn.set_session(autocommit=True)
         cur = conn.cursor()
         cur.execute("VACUUM FULL")
@@ -409,14 +1284,30 @@ def delete_all_connected_posts():
                     pass
 
 def get_pool_status() -> dict[str, Any]:
-    """Get current status of the connection pool."""
+    """Get current status of the connection pool and its checkout metrics."""
+    with pool_metrics_lock:
+        metrics = {
+            "checkouts": pool_metrics['checkouts'],
+            "exhausted": pool_metrics['exhausted'],
+            "timeouts": pool_metrics['timeouts'],
+            "retries": pool_metrics['retries'],
+            "waiting": pool_metrics['waiting'],
+            "pings": pool_metrics['pings'],
+            "stale": pool_metrics['stale'],
+            "wait_seconds": pool_metrics['wait'].snapshot(),
+            "hold_seconds": {caller: hist.snapshot() for caller, hist in pool_metrics['hold'].items()},
+        }
+
     if connection_pool is None:
-        return {"status": "not_initialized"}
+        return {"status": "not_initialized", **metrics}
     
     return {
         "status": "active",
         "min_connections": connection_pool.minconn,
         "max_connections": connection_pool.maxconn,
         "used_connections": len(connection_pool._used),
-        "free_connections": len(connection_pool._pool)
+        "free_connections": len(connection_pool._pool),
+        "timeout_seconds": DB_POOL_TIMEOUT,
+        "pre_ping_idle_seconds": DB_PRE_PING_IDLE,
+        **metrics,
     }
\ No newline at end of file